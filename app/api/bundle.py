@@ -0,0 +1,32 @@
+# Montagem da resposta do /bundle.
+# A query DASHBOARD_BUNDLE devolve as linhas de todos os agregados juntas;
+# aqui elas são separadas por bundle_set e ficam com as mesmas colunas dos
+# endpoints individuais. Ordem e corte do top vêm prontos do banco.
+
+from sqlalchemy import Row
+
+# Colunas de cada agregado, como nos endpoints individuais
+# (nome no pacote -> coluna da query)
+BUNDLE_COLUMNS: dict[str, dict[str, str]] = {
+    "monthly": {"month": "month", "revenue": "revenue", "units": "units",
+                "discount": "discount", "rows": "rows"},
+    "daily": {"date": "date", "revenue": "revenue", "units": "units", "discount": "discount"},
+    "top_products": {"sku": "sku", "product_name": "product_name", "category": "category",
+                     "units": "units", "revenue": "revenue"},
+    "stores": {"store_name": "store_name", "revenue": "revenue", "units": "units",
+               "transaction_count": "rows"},
+    "stores_monthly": {"month": "month", "store_name": "store_name", "revenue": "revenue"},
+    "categories": {"category": "category", "revenue": "revenue", "units": "units"},
+    "heatmap": {"store_name": "store_name", "category": "category", "revenue": "revenue"},
+}
+
+
+def split_bundle(rows: list[Row]) -> dict[str, list[dict]]:
+    """Separa as linhas da DASHBOARD_BUNDLE por agregado, mantendo a ordem
+    em que vieram do banco (o corte do top também já foi feito lá)."""
+    bundle: dict[str, list[dict]] = {name: [] for name in BUNDLE_COLUMNS}
+    for row in rows:
+        m = row._mapping
+        columns = BUNDLE_COLUMNS[m["bundle_set"]]
+        bundle[m["bundle_set"]].append({name: m[col] for name, col in columns.items()})
+    return bundle
@@ -0,0 +1,206 @@
+# Cache de respostas da API.
+# Os dados só mudam quando o ETL mexe neles, então o resultado de cada
+# endpoint pode ser reaproveitado até a próxima mudança. A tabela
+# etl_versao_dados guarda a "versão" dos dados, que avança a cada recálculo
+# do agregado (execuções, retomadas, backfill, rollup --all), partição
+# desanexada ou migração do hash: quando ela muda, as respostas antigas
+# deixam de valer.
+# As respostas ficam guardadas já serializadas em JSON.
+#
+# Backends: "memory" (LRU no processo, limitado em MB) e "redis"
+# (compartilhado entre processos; exige o pacote redis). Outros podem ser
+# plugados com set_backend(), implementando CacheBackend.
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import API_CACHE_BACKEND, API_CACHE_MAX_MB, API_CACHE_REDIS_URL, API_CACHE_VERSION_TTL
+
+
+class CacheBackend:
+    """Armazenamento das respostas. As chaves já incluem a versão dos dados."""
+
+    name = "base"
+    # Se get/set fazem I/O bloqueante (nos endpoints async, rodam numa thread)
+    blocking = False
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes) -> None:
+        raise NotImplementedError
+
+    def new_version(self, version: int) -> None:
+        """Avisada quando a versão dos dados muda (pode descartar o resto)."""
+
+    def info(self) -> dict:
+        """Números do backend para o /cache/stats."""
+        return {}
+
+
+class MemoryCache(CacheBackend):
+    """LRU no próprio processo, limitado pelo total de bytes guardados."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = value
+            self._bytes += len(value)
+            # Descarta os menos usados até caber no limite
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def new_version(self, version: int) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"entradas": len(self._items), "bytes": self._bytes, "limite_bytes": self.max_bytes}
+
+
+class RedisCache(CacheBackend):
+    """Cache compartilhado entre processos e servidores da API.
+    As chaves antigas não são apagadas: como levam a versão no nome,
+    simplesmente deixam de ser lidas e expiram sozinhas."""
+
+    name = "redis"
+    blocking = True
+
+    def __init__(self, url: str, ttl_seconds: int = 24 * 3600):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("API_CACHE_BACKEND=redis exige o pacote redis (pip install redis)")
+        self._client = redis.Redis.from_url(url)
+        self._ttl = ttl_seconds
+
+    def get(self, key: str) -> bytes | None:
+        return self._client.get(f"api:{key}")
+
+    def set(self, key: str, value: bytes) -> None:
+        self._client.set(f"api:{key}", value, ex=self._ttl)
+
+
+# Versão dos dados, avançada pelo ETL a cada mudança (ver rollup.bump_data_version)
+_VERSION_SQL = text("SELECT COALESCE((SELECT versao FROM etl_versao_dados), 0);")
+
+
+class ResponseCache:
+    """Cache de respostas por endpoint e parâmetros, na versão atual dos dados.
+    A versão é consultada no banco no máximo uma vez a cada
+    API_CACHE_VERSION_TTL segundos."""
+
+    def __init__(self, backend: CacheBackend | None, version_ttl: float = API_CACHE_VERSION_TTL):
+        self.backend = backend
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self._version: int | None = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    async def data_version(self, session: AsyncSession) -> int:
+        """Versão atual dos dados (etl_versao_dados)."""
+        now = time.monotonic()
+        if now - self._checked_at < self.version_ttl and self._version is not None:
+            return self._version
+        version = (await session.execute(_VERSION_SQL)).scalar_one()
+        with self._lock:
+            if version != self._version and self.backend is not None:
+                self.backend.new_version(version)
+            self._version = version
+            self._checked_at = now
+        return version
+
+    async def fetch(
+        self, endpoint: str, params: dict, session: AsyncSession, compute: Callable[[], Awaitable[bytes]]
+    ) -> tuple[bytes, bool]:
+        """Devolve a resposta guardada ou calcula com compute() (corrotina)
+        e guarda. Retorna (corpo JSON, veio do cache).
+        Backends com I/O bloqueante (redis) rodam numa thread."""
+        backend = self.backend
+        if backend is None:
+            return await compute(), False
+
+        args = "&".join(f"{k}={params[k]}" for k in sorted(params))
+        key = f"{await self.data_version(session)}:{endpoint}?{args}"
+        if backend.blocking:
+            body = await asyncio.to_thread(backend.get, key)
+        else:
+            body = backend.get(key)
+        with self._lock:
+            if body is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if body is not None:
+            return body, True
+
+        body = await compute()
+        if backend.blocking:
+            await asyncio.to_thread(backend.set, key, body)
+        else:
+            backend.set(key, body)
+        return body, False
+
+    def stats(self) -> dict:
+        """Acertos, falhas e ocupação do cache."""
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend.name if self.backend else None,
+            "versao_dados": self._version,
+            "acertos": self.hits,
+            "falhas": self.misses,
+            "taxa_acerto": self.hits / total if total else None,
+            **(self.backend.info() if self.backend else {}),
+        }
+
+
+def make_backend(kind: str = API_CACHE_BACKEND) -> CacheBackend | None:
+    """Cria o backend configurado em API_CACHE_BACKEND ("off" desliga o cache)."""
+    if kind == "off":
+        return None
+    if kind == "memory":
+        return MemoryCache(int(API_CACHE_MAX_MB * 1024 * 1024))
+    if kind == "redis":
+        return RedisCache(API_CACHE_REDIS_URL)
+    raise ValueError(f"API_CACHE_BACKEND desconhecido: {kind} (use memory, redis ou off)")
+
+
+# Cache usado pelos endpoints
+response_cache = ResponseCache(make_backend())
+
+
+def set_backend(backend: CacheBackend | None) -> None:
+    """Troca o backend do cache (ex.: um backend próprio, compartilhado)."""
+    response_cache.backend = backend
+    response_cache._version = None
+    response_cache._checked_at = float("-inf")
@@ -0,0 +1,117 @@
+# Consultas genéricas sobre o agregado diário ("cubo").
+# Uma consulta é descrita por dimensões (grão de data, loja, cidade, estado,
+# sku, produto, categoria), métricas (receita, unidades, desconto, linhas) e
+# filtros. Ela é compilada num SELECT parametrizado sobre agg_vendas_diarias:
+# os filtros sempre viram WHERE no banco, e só entram os JOINs com as
+# dimensões que a consulta usa.
+# O SQL compilado fica em cache por "forma" (dimensões, métricas, filtros
+# usados e ordenação); os valores dos filtros são parâmetros, inclusive as
+# listas do IN (bindparam expanding), e não mudam o SQL.
+
+from functools import lru_cache
+
+from sqlalchemy import BigInteger, Date, Float, Integer, String, bindparam, text
+from sqlalchemy.sql.selectable import TextualSelect
+from sqlalchemy.types import TypeEngine
+
+
+# Dimensões: nome -> (expressão SQL, coluna na resposta, tabela de dimensão, tipo)
+DIMENSIONS: dict[str, tuple[str, str, str | None, TypeEngine]] = {
+    "date":     ("f.data_venda",                           "date",         None,      Date()),
+    "week":     ("DATE_TRUNC('week', f.data_venda)::DATE", "week",         None,      Date()),
+    "month":    ("TO_CHAR(f.data_venda, 'YYYY-MM')",       "month",        None,      String()),
+    "year":     ("EXTRACT(YEAR FROM f.data_venda)::INT",   "year",         None,      Integer()),
+    "store":    ("l.nome_loja",                            "store_name",   "loja",    String()),
+    "city":     ("l.cidade",                               "city",         "loja",    String()),
+    "state":    ("l.estado",                               "state",        "loja",    String()),
+    "sku":      ("p.sku",                                  "sku",          "produto", String()),
+    "product":  ("p.nome_produto",                         "product_name", "produto", String()),
+    "category": ("p.categoria",                            "category",     "produto", String()),
+}
+
+# Métricas: nome -> (expressão SQL, tipo); o nome é a coluna na resposta
+METRICS: dict[str, tuple[str, TypeEngine]] = {
+    "revenue":  ("SUM(f.valor_total)::FLOAT",  Float()),
+    "units":    ("SUM(f.quantidade)::BIGINT",  BigInteger()),
+    "discount": ("SUM(f.desconto)::FLOAT",     Float()),
+    "rows":     ("SUM(f.linhas)::BIGINT",      BigInteger()),
+}
+
+# Dimensões que podem ser filtradas (lista de valores aceitos)
+FILTERS = ("store", "city", "state", "sku", "product", "category")
+
+_JOINS = {
+    "loja": "JOIN dim_loja l USING (loja_id)",
+    "produto": "JOIN dim_produto p USING (produto_id)",
+}
+
+
+@lru_cache(maxsize=256)
+def compile_query(
+    dims: tuple[str, ...],
+    metrics: tuple[str, ...],
+    filters: tuple[str, ...] = (),
+    order: str | None = None,
+    desc: bool = False,
+    limited: bool = False,
+) -> TextualSelect:
+    """SQL de uma forma de consulta. Parâmetros: :start e :end (datas),
+    um por filtro (lista, com o nome da dimensão) e :limit se `limited`.
+    Sem `order`, ordena pelas dimensões. Erros de nome viram ValueError."""
+    unknown = [d for d in dims if d not in DIMENSIONS] + [f for f in filters if f not in FILTERS]
+    unknown += [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise ValueError(f"Dimensao, metrica ou filtro desconhecido: {', '.join(unknown)}")
+    if not metrics:
+        raise ValueError("Informe ao menos uma metrica")
+    if order is not None and order not in dims and order not in metrics:
+        raise ValueError(f"Ordenacao por {order}: use uma das dimensoes ou metricas pedidas")
+
+    select = [f"{DIMENSIONS[d][0]} AS {DIMENSIONS[d][1]}" for d in dims]
+    select += [f"{METRICS[m][0]} AS {m}" for m in metrics]
+    tables = {DIMENSIONS[d][2] for d in dims + filters} - {None}
+    where = ["f.data_venda BETWEEN :start AND :end"]
+    where += [f"{DIMENSIONS[f][0]} IN :{f}" for f in filters]
+
+    sql = f"SELECT {', '.join(select)}\nFROM agg_vendas_diarias f"
+    for table in ("loja", "produto"):
+        if table in tables:
+            sql += f"\n{_JOINS[table]}"
+    sql += f"\nWHERE {' AND '.join(where)}"
+    if dims:
+        sql += f"\nGROUP BY {', '.join(str(i + 1) for i in range(len(dims)))}"
+    if order is not None:
+        column = DIMENSIONS[order][1] if order in DIMENSIONS else order
+        sql += f"\nORDER BY {column} {'DESC' if desc else 'ASC'}"
+    elif dims:
+        sql += f"\nORDER BY {', '.join(str(i + 1) for i in range(len(dims)))}"
+    if limited:
+        sql += "\nLIMIT :limit"
+
+    # Colunas tipadas: o streaming em Arrow tira o esquema daqui
+    types = {DIMENSIONS[d][1]: DIMENSIONS[d][3] for d in dims}
+    types.update({m: METRICS[m][1] for m in metrics})
+    return text(sql).bindparams(*(bindparam(f, expanding=True) for f in filters)).columns(**types)
+
+
+def build_query(
+    dims: list[str],
+    metrics: list[str],
+    filters: dict[str, list[str]],
+    order: str | None = None,
+    desc: bool = False,
+    limit: int | None = None,
+) -> tuple[TextualSelect, dict, str]:
+    """Normaliza uma consulta e compila sua forma.
+    Filtros com lista vazia são ignorados; sem métricas, usa todas.
+    Retorna (query, parâmetros sem as datas, chave da forma para o cache)."""
+    dims = list(dict.fromkeys(dims))
+    metrics = list(dict.fromkeys(metrics)) or list(METRICS)
+    used = sorted(f for f, values in filters.items() if values)
+    query = compile_query(tuple(dims), tuple(metrics), tuple(used), order, desc, limit is not None)
+
+    params: dict = {f: sorted(set(filters[f])) for f in used}
+    if limit is not None:
+        params["limit"] = limit
+    shape = f"{','.join(dims)}|{','.join(metrics)}|{order or ''}{' desc' if desc else ''}"
+    return query, params, shape
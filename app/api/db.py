@@ -1,26 +1,44 @@
 # Configuração de conexão com o banco de dados.
 # Usa SQLAlchemy para criar o engine e gerenciar sessões.
 # A URL de conexão vem do arquivo .env via config.py.
+# A API usa o engine assíncrono (psycopg 3 com asyncio): cada requisição
+# esperando o banco não prende uma thread. O engine síncrono fica para o
+# ETL e os scripts.
 
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from typing import AsyncGenerator
 
-from app.config import DATABASE_URL
+from app.config import (
+    DATABASE_URL, API_DB_POOL_SIZE, API_DB_MAX_OVERFLOW, API_DB_POOL_TIMEOUT, API_STATEMENT_TIMEOUT_MS,
+)
 
 # Cria o engine de conexão com o PostgreSQL (Supabase)
 # pool_pre_ping=True garante que conexões inativas sejam testadas antes de usar
 engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_size=5)
 
-# Fábrica de sessões que será usada em todos os endpoints
+# Fábrica de sessões que será usada pelo ETL e pelos scripts
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+# Engine assíncrono da API. O driver é sempre o psycopg 3, que tem suporte
+# nativo a asyncio (mesmo que DATABASE_URL aponte para o psycopg2).
+# O statement_timeout vale para as consultas da API, não para o ETL.
+async_engine = create_async_engine(
+    make_url(DATABASE_URL).set(drivername="postgresql+psycopg"),
+    pool_pre_ping=True,
+    pool_size=API_DB_POOL_SIZE,
+    max_overflow=API_DB_MAX_OVERFLOW,
+    pool_timeout=API_DB_POOL_TIMEOUT,
+    connect_args={"options": f"-c statement_timeout={API_STATEMENT_TIMEOUT_MS}"},
+)
 
-def get_session() -> Generator[Session, None, None]:
-    """Cria uma sessão do banco e garante que ela é fechada após o uso.
-    Usada como dependência (Depends) nos endpoints do FastAPI."""
-    session = SessionLocal()
-    try:
+# Fábrica de sessões assíncronas usada nos endpoints
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Sessão assíncrona para os endpoints (Depends), fechada após o uso."""
+    async with AsyncSessionLocal() as session:
         yield session
-    finally:
-        session.close()
@@ -1,23 +1,42 @@
 # Módulo principal da API FastAPI.
 # Atualizado com novos endpoints: /sales/daily e /stores/monthly.
+# As respostas passam pelo cache de cache.py, invalidado a cada execução do ETL.
+# Os endpoints são assíncronos e usam o pool de conexões assíncronas de db.py.
+# Com ?format=ndjson|csv|arrow, a resposta é enviada em streaming (streaming.py).
 
 import traceback
+from contextlib import asynccontextmanager
 from datetime import date
-from typing import Optional
-
-from fastapi import FastAPI, Depends, Query
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-
-from app.api.db import get_session
+from typing import Awaitable, Callable, Optional
+
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.bundle import split_bundle
+from app.api.cache import response_cache
+from app.api.cube import build_query
+from app.api.db import async_engine, get_async_session
+from app.api.streaming import STREAM_FORMATS, stream_query
 from app.api.queries import (
-    MONTHLY_REVENUE, DAILY_REVENUE, TOP_PRODUCTS, STORE_PERFORMANCE, STORE_MONTHLY, CATEGORY_PERFORMANCE, HEATMAP_DATA
+    MONTHLY_REVENUE, DAILY_REVENUE, TOP_PRODUCTS, STORE_PERFORMANCE, STORE_MONTHLY, CATEGORY_PERFORMANCE, HEATMAP_DATA,
+    DASHBOARD_BUNDLE,
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Ao desligar a API, fecha as conexões do pool assíncrono."""
+    yield
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title="API de Análise de Vendas",
     version="2.3.0",
     description="API REST para dashboard de vendas.",
+    lifespan=lifespan,
 )
 
 
@@ -32,83 +51,173 @@ async def global_exception_handler(request, exc):
     )
 
 
+async def cached_response(
+    endpoint: str, params: dict, session: AsyncSession, compute: Callable[[], Awaitable[object]]
+) -> Response:
+    """Devolve em JSON o resultado de compute() (ou a resposta do cache).
+    O cabeçalho X-Cache diz se a resposta veio do cache (HIT) ou não (MISS)."""
+    async def encode() -> bytes:
+        return JSONResponse(jsonable_encoder(await compute())).body
+
+    body, hit = await response_cache.fetch(endpoint, params, session, encode)
+    return Response(body, media_type="application/json", headers={"X-Cache": "HIT" if hit else "MISS"})
+
+
+async def cached_query(endpoint: str, query, params: dict, session: AsyncSession) -> Response:
+    """Executa a query (ou reaproveita a resposta do cache) e devolve o JSON."""
+    async def compute() -> list[dict]:
+        result = await session.execute(query, params)
+        return [dict(r._mapping) for r in result]
+
+    return await cached_response(endpoint, params, session, compute)
+
+
+def output_format(
+    format: str = Query("json", pattern=f"^(json|{'|'.join(STREAM_FORMATS)})$",
+                        description="json, ou ndjson/csv/arrow em streaming"),
+) -> str:
+    """Formato da resposta pedido no parâmetro format."""
+    return format
+
+
+async def respond(endpoint: str, query, params: dict, session: AsyncSession, fmt: str) -> Response:
+    """JSON (com cache) ou streaming, conforme o formato pedido."""
+    if fmt == "json":
+        return await cached_query(endpoint, query, params, session)
+    return stream_query(endpoint, query, params, fmt)
+
+
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Acertos, falhas e ocupação do cache de respostas."""
+    return response_cache.stats()
+
+
 @app.get("/sales/monthly")
-def vendas_mensais(
+async def vendas_mensais(
     start: date = Query(..., description="Data inicial"),
     end: date = Query(..., description="Data final"),
-    session: Session = Depends(get_session),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """Receita agregada por mês."""
-    rows = session.execute(MONTHLY_REVENUE, {"start": start, "end": end})
-    return [dict(r._mapping) for r in rows]
+    return await respond("MONTHLY_REVENUE", MONTHLY_REVENUE, {"start": start, "end": end}, session, fmt)
 
 
 @app.get("/sales/daily")
-def vendas_diarias(
+async def vendas_diarias(
     start: date = Query(..., description="Data inicial"),
     end: date = Query(..., description="Data final"),
-    session: Session = Depends(get_session),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """[NOVO] Receita agregada por dia."""
-    rows = session.execute(DAILY_REVENUE, {"start": start, "end": end})
-    return [dict(r._mapping) for r in rows]
+    return await respond("DAILY_REVENUE", DAILY_REVENUE, {"start": start, "end": end}, session, fmt)
 
 
 @app.get("/products/top")
-def produtos_top(
+async def produtos_top(
     start: date = Query(..., description="Data inicial"),
     end: date = Query(..., description="Data final"),
     limit: Optional[int] = Query(10, description="Limite"),
-    session: Session = Depends(get_session),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """Ranking de produtos."""
-    rows = session.execute(TOP_PRODUCTS, {"start": start, "end": end, "limit": limit})
-    return [dict(r._mapping) for r in rows]
+    return await respond("TOP_PRODUCTS", TOP_PRODUCTS, {"start": start, "end": end, "limit": limit}, session, fmt)
 
 
 @app.get("/stores/performance")
-def performance_lojas(
+async def performance_lojas(
     start: date = Query(..., description="Data inicial"),
     end: date = Query(..., description="Data final"),
-    session: Session = Depends(get_session),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """Desempenho total por loja no período."""
-    rows = session.execute(STORE_PERFORMANCE, {"start": start, "end": end})
-    return [dict(r._mapping) for r in rows]
+    return await respond("STORE_PERFORMANCE", STORE_PERFORMANCE, {"start": start, "end": end}, session, fmt)
 
 
 @app.get("/stores/monthly")
-def performance_lojas_mensal(
+async def performance_lojas_mensal(
     start: date = Query(..., description="Data inicial"),
     end: date = Query(..., description="Data final"),
-    session: Session = Depends(get_session),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """[NOVO] Desempenho mensal por loja (para gráficos comparativos)."""
-    rows = session.execute(STORE_MONTHLY, {"start": start, "end": end})
-    return [dict(r._mapping) for r in rows]
+    return await respond("STORE_MONTHLY", STORE_MONTHLY, {"start": start, "end": end}, session, fmt)
 
 
 @app.get("/products/categories")
-def performance_categorias(
+async def performance_categorias(
     start: date = Query(..., description="Data inicial"),
     end: date = Query(..., description="Data final"),
-    session: Session = Depends(get_session),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """Desempenho por categoria."""
-    rows = session.execute(CATEGORY_PERFORMANCE, {"start": start, "end": end})
-    return [dict(r._mapping) for r in rows]
+    return await respond("CATEGORY_PERFORMANCE", CATEGORY_PERFORMANCE, {"start": start, "end": end}, session, fmt)
     
 @app.get("/analysis/heatmap")
-def heatmap_loja_categoria(
+async def heatmap_loja_categoria(
     start: date = Query(..., description="Data inicial"),
     end: date = Query(..., description="Data final"),
-    session: Session = Depends(get_session),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
 ):
     """[NOVO] Dados cruzados Loja x Categoria para Heatmap."""
-    rows = session.execute(HEATMAP_DATA, {"start": start, "end": end})
-    return [dict(r._mapping) for r in rows]
+    return await respond("HEATMAP_DATA", HEATMAP_DATA, {"start": start, "end": end}, session, fmt)
+
+
+@app.get("/bundle")
+async def pacote_dashboard(
+    start: date = Query(..., description="Data inicial"),
+    end: date = Query(..., description="Data final"),
+    limit: int = Query(10, ge=1, description="Limite do top de produtos"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Todos os agregados do dashboard numa consulta só (GROUPING SETS):
+    monthly, daily, top_products, stores, stores_monthly, categories e heatmap."""
+    params = {"start": start, "end": end, "limit": limit}
+
+    async def compute() -> dict[str, list[dict]]:
+        result = await session.execute(DASHBOARD_BUNDLE, params)
+        return split_bundle(result.all())
+
+    return await cached_response("DASHBOARD_BUNDLE", params, session, compute)
+
+
+@app.get("/query")
+async def consulta_cubo(
+    start: date = Query(..., description="Data inicial"),
+    end: date = Query(..., description="Data final"),
+    dims: list[str] = Query([], description="date, week, month, year, store, city, state, sku, product, category"),
+    metrics: list[str] = Query([], description="revenue, units, discount, rows (padrão: todas)"),
+    store: list[str] = Query([], description="Filtro: lojas"),
+    city: list[str] = Query([], description="Filtro: cidades"),
+    state: list[str] = Query([], description="Filtro: estados"),
+    sku: list[str] = Query([], description="Filtro: SKUs"),
+    product: list[str] = Query([], description="Filtro: nomes de produto"),
+    category: list[str] = Query([], description="Filtro: categorias"),
+    order: Optional[str] = Query(None, description="Dimensão ou métrica para ordenar"),
+    desc: bool = Query(False, description="Ordem decrescente"),
+    limit: Optional[int] = Query(None, ge=1, description="Limite de linhas"),
+    fmt: str = Depends(output_format),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Consulta genérica: agrupa pelas dimensões, soma as métricas e filtra
+    no banco. Ex.: /query?start=...&end=...&dims=month&dims=store&metrics=revenue&category=Livros"""
+    filters = {"store": store, "city": city, "state": state, "sku": sku,
+               "product": product, "category": category}
+    try:
+        query, params, shape = build_query(dims, metrics, filters, order, desc, limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    params.update({"start": start, "end": end})
+    return await respond(f"QUERY {shape}", query, params, session, fmt)
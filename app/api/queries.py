@@ -1,100 +1,107 @@
 # Queries SQL usadas pela API.
 # Atualizado para incluir análise diária e mensal por loja.
+# Todas leem o agregado diário agg_vendas_diarias (dia x loja x produto,
+# mantido pelo ETL em app/etl/rollup.py), não as linhas da fato_vendas:
+# o custo depende de dias x lojas x produtos, não do número de vendas.
+# Contagens de vendas somam a coluna linhas do agregado.
+# As formas simples são consultas do cubo (cube.py); ficam escritas à mão
+# só as que o cubo não expressa.
 
-from sqlalchemy import text
+from sqlalchemy import BigInteger, Float, String, text
+
+from app.api.cube import compile_query
 
 # Receita, unidades e descontos agrupados por mês
-MONTHLY_REVENUE = text("""
-    SELECT
-        TO_CHAR(data_venda, 'YYYY-MM') AS month,
-        SUM(valor_total)::FLOAT        AS revenue,
-        SUM(quantidade)                AS units,
-        SUM(desconto)::FLOAT           AS discount,
-        COUNT(*)                       AS rows
-    FROM fato_vendas
-    WHERE data_venda BETWEEN :start AND :end
-    GROUP BY 1
-    ORDER BY 1;
-""")
+MONTHLY_REVENUE = compile_query(("month",), ("revenue", "units", "discount", "rows"))
 
 # [NOVO] Receita diária para tendências detalhadas
-DAILY_REVENUE = text("""
-    SELECT
-        data_venda                     AS date,
-        SUM(valor_total)::FLOAT        AS revenue,
-        SUM(quantidade)                AS units,
-        SUM(desconto)::FLOAT           AS discount
-    FROM fato_vendas
-    WHERE data_venda BETWEEN :start AND :end
-    GROUP BY 1
-    ORDER BY 1;
-""")
+DAILY_REVENUE = compile_query(("date",), ("revenue", "units", "discount"))
 
 # Top N produtos por receita
-TOP_PRODUCTS = text("""
-    SELECT
-        p.sku,
-        p.nome_produto  AS product_name,
-        p.categoria     AS category,
-        SUM(f.quantidade)            AS units,
-        SUM(f.valor_total)::FLOAT    AS revenue
-    FROM fato_vendas f
-    JOIN dim_produto p USING (produto_id)
-    WHERE f.data_venda BETWEEN :start AND :end
-    GROUP BY p.sku, p.nome_produto, p.categoria
-    ORDER BY revenue DESC
-    LIMIT :limit;
-""")
+TOP_PRODUCTS = compile_query(
+    ("sku", "product", "category"), ("units", "revenue"), order="revenue", desc=True, limited=True
+)
 
-# Desempenho por loja (Total)
+# Desempenho por loja (Total); a contagem sai como transaction_count, nome fora do cubo
 STORE_PERFORMANCE = text("""
     SELECT
         l.nome_loja   AS store_name,
         SUM(f.valor_total)::FLOAT AS revenue,
-        SUM(f.quantidade)         AS units,
-        COUNT(*)                  AS transaction_count
-    FROM fato_vendas f
+        SUM(f.quantidade)::BIGINT AS units,
+        SUM(f.linhas)::BIGINT     AS transaction_count
+    FROM agg_vendas_diarias f
     JOIN dim_loja l USING (loja_id)
     WHERE f.data_venda BETWEEN :start AND :end
     GROUP BY l.nome_loja
     ORDER BY revenue DESC;
-""")
+""").columns(store_name=String, revenue=Float, units=BigInteger, transaction_count=BigInteger)
 
 # [NOVO] Desempenho por loja (Mensal) para comparação temporal
-STORE_MONTHLY = text("""
-    SELECT
-        TO_CHAR(f.data_venda, 'YYYY-MM') AS month,
-        l.nome_loja   AS store_name,
-        SUM(f.valor_total)::FLOAT AS revenue
-    FROM fato_vendas f
-    JOIN dim_loja l USING (loja_id)
-    WHERE f.data_venda BETWEEN :start AND :end
-    GROUP BY 1, 2
-    ORDER BY 1, 2;
-""")
+STORE_MONTHLY = compile_query(("month", "store"), ("revenue",))
 
 # Desempenho por Categoria
-CATEGORY_PERFORMANCE = text("""
-    SELECT
-        p.categoria               AS category,
-        SUM(f.valor_total)::FLOAT AS revenue,
-        SUM(f.quantidade)         AS units
-    FROM fato_vendas f
-    JOIN dim_produto p USING (produto_id)
-    WHERE f.data_venda BETWEEN :start AND :end
-    GROUP BY 1
-    ORDER BY revenue DESC;
-""")
+CATEGORY_PERFORMANCE = compile_query(("category",), ("revenue", "units"), order="revenue", desc=True)
 
 # [NOVO Power BI] Heatmap Loja x Categoria
-HEATMAP_DATA = text("""
-    SELECT
-        l.nome_loja   AS store_name,
-        p.categoria     AS category,
-        SUM(f.valor_total)::FLOAT AS revenue
-    FROM fato_vendas f
-    JOIN dim_loja l USING (loja_id)
-    JOIN dim_produto p USING (produto_id)
-    WHERE f.data_venda BETWEEN :start AND :end
-    GROUP BY 1, 2;
+HEATMAP_DATA = compile_query(("store", "category"), ("revenue",))
+
+# Pacote do dashboard: todos os agregados acima numa única passada pelo
+# agregado diário, com GROUPING SETS. A coluna bundle_set diz a que
+# agregado cada linha pertence (as colunas fora do conjunto vêm NULL);
+# o GROUPING() tem um bit por coluna, ligado quando ela não agrupa a linha.
+# O top de produtos é cortado no banco (ROW_NUMBER) e cada agregado sai na
+# mesma ordem do endpoint individual, com a collation do banco.
+DASHBOARD_BUNDLE = text("""
+    WITH base AS (
+        SELECT
+            TO_CHAR(f.data_venda, 'YYYY-MM') AS month,
+            f.data_venda    AS date,
+            p.sku,
+            p.nome_produto  AS product_name,
+            p.categoria     AS category,
+            l.nome_loja     AS store_name,
+            f.valor_total, f.quantidade, f.desconto, f.linhas
+        FROM agg_vendas_diarias f
+        JOIN dim_loja l USING (loja_id)
+        JOIN dim_produto p USING (produto_id)
+        WHERE f.data_venda BETWEEN :start AND :end
+    ),
+    sets AS (
+        SELECT
+            CASE GROUPING(month, date, sku, store_name, category)
+                WHEN 15 THEN 'monthly'
+                WHEN 23 THEN 'daily'
+                WHEN 26 THEN 'top_products'
+                WHEN 29 THEN 'stores'
+                WHEN 13 THEN 'stores_monthly'
+                WHEN 30 THEN 'categories'
+                WHEN 28 THEN 'heatmap'
+            END AS bundle_set,
+            month, date, sku, product_name, category, store_name,
+            SUM(valor_total)::FLOAT AS revenue,
+            SUM(quantidade)::BIGINT AS units,
+            SUM(desconto)::FLOAT    AS discount,
+            SUM(linhas)::BIGINT     AS rows
+        FROM base
+        GROUP BY GROUPING SETS (
+            (month),
+            (date),
+            (sku, product_name, category),
+            (store_name),
+            (month, store_name),
+            (category),
+            (store_name, category)
+        )
+    ),
+    ranked AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY bundle_set ORDER BY revenue DESC) AS posicao
+        FROM sets
+    )
+    SELECT bundle_set, month, date, sku, product_name, category, store_name,
+           revenue, units, discount, rows
+    FROM ranked
+    WHERE bundle_set <> 'top_products' OR posicao <= :limit
+    ORDER BY bundle_set,
+             CASE WHEN bundle_set IN ('top_products', 'stores', 'categories') THEN revenue END DESC,
+             month, date, store_name, category;
 """)
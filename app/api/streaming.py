@@ -0,0 +1,162 @@
+# Respostas em streaming para resultados grandes.
+# Com format=ndjson, csv ou arrow, as linhas vêm de um cursor no servidor
+# (session.stream) em lotes de API_STREAM_BATCH_ROWS e cada lote é
+# serializado e enviado antes de buscar o próximo: a memória por requisição
+# não depende do tamanho do resultado. Essas respostas não passam pelo
+# cache, que guarda corpos inteiros.
+#
+# O formato arrow é um stream IPC do Apache Arrow, com o esquema tirado
+# dos tipos declarados nas colunas da query: quem lê (pandas,
+# notebooks) recebe colunas tipadas sem interpretar JSON, por exemplo
+#   pyarrow.ipc.open_stream(requests.get(url, stream=True).raw).read_pandas()
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Callable
+
+import pyarrow as pa
+from fastapi.responses import StreamingResponse
+from sqlalchemy.sql import sqltypes
+
+from app.api.db import AsyncSessionLocal
+from app.config import API_STREAM_BATCH_ROWS
+
+# Formatos de streaming e o content-type de cada um
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+async def _batches(query, params: dict, size: int) -> AsyncIterator[tuple[list[str], list]]:
+    """Lotes de linhas lidos de um cursor no servidor, como (colunas, linhas).
+    A sessão é aberta aqui, e não via Depends: ela precisa durar até o fim
+    do envio, depois que o endpoint já retornou."""
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=size), params)
+        columns = list(result.keys())
+        sent = False
+        async for rows in result.partitions(size):
+            sent = True
+            yield columns, rows
+        if not sent:
+            yield columns, []
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo nao serializavel: {type(value).__name__}")
+
+
+async def _ndjson(batches) -> AsyncIterator[bytes]:
+    """Um objeto JSON por linha."""
+    async for columns, rows in batches:
+        if rows:
+            yield "".join(
+                json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows
+            ).encode()
+
+
+async def _csv(batches) -> AsyncIterator[bytes]:
+    """CSV com cabeçalho."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    header = True
+    async for columns, rows in batches:
+        if header:
+            writer.writerow(columns)
+            header = False
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+# Tipos SQLAlchemy -> Arrow (subclasses antes das classes base)
+_ARROW_TYPES = [
+    (sqltypes.BigInteger, pa.int64()),
+    (sqltypes.Integer, pa.int32()),
+    (sqltypes.Float, pa.float64()),
+    (sqltypes.Numeric, pa.float64()),
+    (sqltypes.DateTime, pa.timestamp("us")),
+    (sqltypes.Date, pa.date32()),
+    (sqltypes.String, pa.string()),
+]
+
+
+def arrow_schema(query) -> pa.Schema | None:
+    """Esquema Arrow tirado dos tipos declarados nas colunas da query
+    (text().columns(...)). None se alguma coluna não tem tipo conhecido."""
+    fields = []
+    for column in getattr(query, "selected_columns", ()):
+        arrow_type = next((t for sql, t in _ARROW_TYPES if isinstance(column.type, sql)), None)
+        if arrow_type is None:
+            return None
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields) if fields else None
+
+
+def _infer_schema(columns: list[str], rows: list) -> pa.Schema:
+    """Esquema de uma query sem tipos declarados, pelos valores do primeiro
+    lote. Colunas só com nulos nesse lote viram texto, e não o tipo null,
+    que não aceitaria os valores dos lotes seguintes."""
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    fields = []
+    for name, v in zip(columns, values):
+        arrow_type = pa.array(v).type
+        fields.append(pa.field(name, pa.string() if pa.types.is_null(arrow_type) else arrow_type))
+    return pa.schema(fields)
+
+
+def _arrow_batch(rows: list, schema: pa.Schema) -> pa.RecordBatch:
+    """Lote de linhas como RecordBatch (colunas) no esquema da resposta."""
+    values = list(zip(*rows)) if rows else [() for _ in schema]
+    arrays = [pa.array(v, type=field.type) for v, field in zip(values, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def _arrow(batches, schema: pa.Schema | None = None) -> AsyncIterator[bytes]:
+    """Stream IPC do Arrow: o esquema e depois um RecordBatch por lote.
+    Sem `schema`, ele é deduzido do primeiro lote."""
+    sink = io.BytesIO()
+    writer = None
+
+    def take() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    async for columns, rows in batches:
+        if writer is None:
+            schema = schema or _infer_schema(columns, rows)
+            writer = pa.ipc.new_stream(sink, schema)
+        if rows:
+            writer.write_batch(_arrow_batch(rows, schema))
+        yield take()
+    writer.close()
+    yield take()
+
+
+_WRITERS: dict[str, Callable] = {"ndjson": _ndjson, "csv": _csv, "arrow": _arrow}
+
+
+def stream_query(
+    endpoint: str, query, params: dict, fmt: str, size: int = API_STREAM_BATCH_ROWS
+) -> StreamingResponse:
+    """Resposta em streaming da query no formato `fmt` (ndjson, csv ou arrow)."""
+    batches = _batches(query, params, size)
+    body = _arrow(batches, arrow_schema(query)) if fmt == "arrow" else _WRITERS[fmt](batches)
+    extension = "arrows" if fmt == "arrow" else fmt
+    return StreamingResponse(
+        body,
+        media_type=STREAM_FORMATS[fmt],
+        headers={"Content-Disposition": f'inline; filename="{endpoint.lower()}.{extension}"'},
+    )
@@ -13,3 +13,69 @@ DATABASE_URL: str = os.environ["DATABASE_URL"]
 
 # URL base da API (usada internamente)
 API_BASE_URL: str = os.getenv("API_BASE_URL", "http://localhost:8000")
+
+# Modo de carga da tabela fato: "copy" (COPY em lote via tabela temporária)
+# ou "insert" (um INSERT por linha, modo antigo)
+ETL_LOAD_MODE: str = os.getenv("ETL_LOAD_MODE", "copy")
+
+# Quantidade de linhas enviadas por lote no modo COPY
+ETL_BATCH_SIZE: int = int(os.getenv("ETL_BATCH_SIZE", "50000"))
+
+# Tamanho dos blocos lidos do CSV no modo streaming (0 = arquivo inteiro de uma vez)
+ETL_CHUNK_SIZE: int = int(os.getenv("ETL_CHUNK_SIZE", "100000"))
+
+# Processos de leitura/transformação na carga de vários arquivos
+ETL_WORKERS: int = int(os.getenv("ETL_WORKERS", str(os.cpu_count() or 1)))
+
+# Conexões simultâneas de carga no banco na carga de vários arquivos
+ETL_DB_CONNECTIONS: int = int(os.getenv("ETL_DB_CONNECTIONS", "4"))
+
+# Descarta no cliente as vendas já gravadas (e as repetidas no próprio arquivo)
+# antes de enviá-las ao banco. Vale a pena quando os arquivos se sobrepõem muito.
+ETL_PREDEDUP: bool = os.getenv("ETL_PREDEDUP", "0") == "1"
+
+# Sobrepõe leitura, transformação e carga dos blocos de um arquivo
+ETL_PIPELINE: bool = os.getenv("ETL_PIPELINE", "1") == "1"
+
+# Máximo de blocos esperando carga no pipeline (limita a memória)
+ETL_PIPELINE_DEPTH: int = int(os.getenv("ETL_PIPELINE_DEPTH", "4"))
+
+# Conexões usadas para carregar as vendas de um bloco em paralelo, cada uma
+# com uma faixa de datas (1 = carga serial na conexão do bloco)
+ETL_FACT_CONNECTIONS: int = int(os.getenv("ETL_FACT_CONNECTIONS", "1"))
+
+# Formato da chave de deduplicação hash_origem: "hex" (SHA-256 em texto),
+# "bytea" (16 bytes) ou "int64" (inteiro de 8 bytes). Precisa bater com o tipo
+# da coluna no banco; para trocar, rode python -m app.etl.hashkey --migrate <formato>
+ETL_HASH_MODE: str = os.getenv("ETL_HASH_MODE", "hex")
+
+# Daemon de pasta de entrada (python -m app.etl.daemon):
+# intervalo entre varreduras da pasta (s), tempo máximo que um arquivo pronto
+# espera para formar um lote (s) e tamanho que fecha o lote na hora (bytes)
+ETL_DAEMON_POLL: float = float(os.getenv("ETL_DAEMON_POLL", "0.5"))
+ETL_DAEMON_WINDOW: float = float(os.getenv("ETL_DAEMON_WINDOW", "2"))
+ETL_DAEMON_MAX_BYTES: int = int(os.getenv("ETL_DAEMON_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Pool de conexões assíncronas da API: conexões mantidas abertas, extras
+# permitidas em picos e espera máxima (s) por uma conexão livre
+API_DB_POOL_SIZE: int = int(os.getenv("API_DB_POOL_SIZE", "20"))
+API_DB_MAX_OVERFLOW: int = int(os.getenv("API_DB_MAX_OVERFLOW", "10"))
+API_DB_POOL_TIMEOUT: float = float(os.getenv("API_DB_POOL_TIMEOUT", "10"))
+
+# Tempo máximo de cada consulta da API no banco, em ms (0 = sem limite)
+API_STATEMENT_TIMEOUT_MS: int = int(os.getenv("API_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Linhas buscadas do cursor por lote nas respostas em streaming (format=ndjson/csv/arrow)
+API_STREAM_BATCH_ROWS: int = int(os.getenv("API_STREAM_BATCH_ROWS", "10000"))
+
+# Cache de respostas da API: "memory" (no processo), "redis" (compartilhado) ou "off"
+API_CACHE_BACKEND: str = os.getenv("API_CACHE_BACKEND", "memory")
+
+# Limite de memória do cache "memory", em MB
+API_CACHE_MAX_MB: float = float(os.getenv("API_CACHE_MAX_MB", "64"))
+
+# URL do Redis para o cache "redis"
+API_CACHE_REDIS_URL: str = os.getenv("API_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Intervalo (s) entre consultas da versão dos dados (última execução do ETL com sucesso)
+API_CACHE_VERSION_TTL: float = float(os.getenv("API_CACHE_VERSION_TTL", "2"))
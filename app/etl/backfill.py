@@ -0,0 +1,153 @@
+# Reprocessamento (backfill) de um intervalo de datas.
+# Apaga as vendas do intervalo, recarrega a partir dos arquivos informados
+# e recalcula o agregado diário desses dias, tudo numa única transação e
+# numa única linha de etl_execucoes. Meses inteiros do intervalo são
+# esvaziados com TRUNCATE da partição; as pontas, com DELETE por data.
+# Com a partição vazia, o ON CONFLICT não tem hash antigo para conferir.
+#
+# Uso: python -m app.etl.backfill INICIO FIM ARQUIVO [ARQUIVO ...]
+
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.api.db import SessionLocal
+from app.config import ETL_CHUNK_SIZE
+from app.etl.extract import read_file_blocks
+from app.etl.hashkey import check_hash_mode
+from app.etl.load import (
+    upsert_stores, upsert_products, bulk_insert_facts, quarantine_rows, clear_dimension_cache,
+)
+from app.etl.metrics import RunMetrics, timed_transform
+from app.etl.partitions import ensure_partitions, partition_name
+from app.etl.rollup import mark_days, refresh_rollup
+from app.etl.run_etl import start_execution, finish_execution, fail_execution, resolve_sources
+
+
+def month_starts(start: date, end: date) -> list[date]:
+    """Primeiro dia de cada mês que o intervalo toca."""
+    return [p.start_time.date() for p in pd.period_range(start, end, freq="M")]
+
+
+def clear_range(session: Session, start: date, end: date) -> None:
+    """Apaga as vendas do intervalo, sem commit.
+    Partições de meses inteiramente dentro do intervalo são truncadas;
+    nos meses das pontas, só os dias do intervalo são apagados."""
+    for month in month_starts(start, end):
+        name = partition_name(month)
+        month_end = (pd.Timestamp(month) + pd.offsets.MonthEnd(0)).date()
+        if start <= month and month_end <= end:
+            session.execute(text(f"TRUNCATE {name};"))
+        else:
+            session.execute(
+                text(f"DELETE FROM {name} WHERE data_venda BETWEEN :start AND :end;"),
+                {"start": max(start, month), "end": min(end, month_end)},
+            )
+
+
+def backfill(
+    start: date, end: date, sources: list[Path], chunk_size: int = ETL_CHUNK_SIZE
+) -> RunMetrics:
+    """Substitui as vendas de start a end pelas dos arquivos `sources`.
+    Só as linhas com data dentro do intervalo são carregadas; as demais
+    contam como ignoradas. Vendas, agregado e quarentena entram numa
+    transação só: se algo falha, o intervalo fica como estava.
+    Os arquivos não entram no manifesto, já que só parte deles foi lida.
+    Retorna as medições por etapa, também gravadas em etl_etapas."""
+    if start > end:
+        raise ValueError(f"Intervalo invalido: {start} > {end}")
+
+    session = SessionLocal()
+    run_id: int | None = None
+    metrics = RunMetrics()
+    rows_read = inserted = skipped = 0
+
+    try:
+        check_hash_mode(session)
+        # Todas as partições do intervalo antes da transação: criá-las no
+        # meio dela esperaria pelas travas que a própria transação segura
+        ensure_partitions(session, pd.Series(pd.to_datetime(month_starts(start, end))))
+        names = ", ".join(p.name for p in sources)
+        run_id = start_execution(session, f"backfill {start}..{end}: {names}")
+
+        with metrics.stage("remocao"):
+            clear_range(session, start, end)
+
+        lower, upper = pd.Timestamp(start), pd.Timestamp(end)
+        index = 0
+        for path in sources:
+            for chunk, _ in metrics.timed_chunks(read_file_blocks(path, chunk_size), index):
+                rows_read += len(chunk)
+                df, rejected, measures = timed_transform(chunk)
+                metrics.extend(measures, index)
+                if not rejected.empty:
+                    with metrics.stage("quarentena", index, len(rejected)):
+                        quarantine_rows(session, run_id, index, rejected)
+
+                in_range = df[df["sale_date"].between(lower, upper)]
+                skipped += len(chunk) - len(in_range)
+                with metrics.stage("dimensoes", index, len(in_range)):
+                    store_map = upsert_stores(session, in_range)
+                    product_map = upsert_products(session, in_range)
+                with metrics.stage("fatos", index, len(in_range)):
+                    chunk_inserted, chunk_skipped = bulk_insert_facts(
+                        session, in_range, store_map, product_map
+                    )
+                inserted += chunk_inserted
+                skipped += chunk_skipped
+                index += 1
+
+        # Todos os dias do intervalo, inclusive os que ficaram sem vendas
+        mark_days(session, [d.date() for d in pd.date_range(start, end, freq="D")])
+        with metrics.stage("agregado") as info:
+            # O refresh faz o commit de tudo: remoção, vendas e agregado
+            info["rows"] = refresh_rollup(session)
+
+        metrics.save(session, run_id)
+        finish_execution(session, run_id, rows_read, inserted, skipped)
+        print(f"Backfill {start}..{end} concluido! Lidas={rows_read}  "
+              f"Inseridas={inserted}  Ignoradas={skipped}")
+        return metrics
+
+    except Exception as exc:
+        session.rollback()
+        clear_dimension_cache()
+        if run_id is not None:
+            metrics.save(session, run_id)
+            fail_execution(session, run_id, str(exc))
+        print(f"Backfill falhou: {exc}", file=sys.stderr)
+        raise
+
+    finally:
+        session.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Interpreta a linha de comando e dispara o backfill."""
+    parser = argparse.ArgumentParser(description="Reprocessa as vendas de um intervalo de datas")
+    parser.add_argument("start", type=date.fromisoformat, help="primeiro dia (AAAA-MM-DD)")
+    parser.add_argument("end", type=date.fromisoformat, help="último dia (AAAA-MM-DD)")
+    parser.add_argument("sources", nargs="+",
+                        help="arquivos, diretórios ou globs com as vendas corrigidas")
+    parser.add_argument("--chunk-size", type=int, default=ETL_CHUNK_SIZE,
+                        help="linhas por bloco (0 = arquivo inteiro)")
+    parser.add_argument("--stats", action="store_true",
+                        help="imprime o tempo e a vazão de cada etapa ao final")
+    args = parser.parse_args(argv)
+
+    sources = [p for s in args.sources for p in resolve_sources(s)]
+    if not sources:
+        parser.error("nenhum arquivo encontrado")
+
+    metrics = backfill(args.start, args.end, sources, args.chunk_size)
+    if args.stats:
+        print(metrics.report())
+
+
+if __name__ == "__main__":
+    main()
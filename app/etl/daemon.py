@@ -0,0 +1,231 @@
+# Daemon do ETL para uma pasta de entrada.
+# Fica rodando, vigia a pasta e carrega os arquivos que chegam em pequenos
+# lotes, sem pagar a cada carga a subida do Python, o import do pandas e
+# uma conexão nova: o pool de conexões, o pool de processos e os caches de
+# dimensões e partições continuam quentes entre um lote e outro.
+# Arquivos carregados vão para a pasta de arquivados; os que falham, para
+# a pasta de erro.
+#
+# Uso: python -m app.etl.daemon PASTA [--archive DIR] [--errors DIR] [--window S]
+
+import argparse
+import shutil
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from app.config import (
+    ETL_WORKERS, ETL_DB_CONNECTIONS, ETL_DAEMON_POLL, ETL_DAEMON_WINDOW, ETL_DAEMON_MAX_BYTES,
+)
+from app.etl.run_etl import FilesFailedError, resolve_sources, run_many
+
+# Espera (s) antes de tentar de novo um lote que falhou por inteiro (ex.: banco fora)
+_RETRY_DELAY = 10.0
+
+
+@dataclass
+class InboxFile:
+    """Um arquivo visto na pasta de entrada."""
+    size: int
+    mtime_ns: int
+    seen_at: float               # quando apareceu na pasta
+    ready_at: float | None = None  # quando parou de mudar (None = ainda sendo gravado)
+
+
+def scan(inbox: Path, files: dict[Path, InboxFile], now: float) -> None:
+    """Atualiza o estado dos arquivos da pasta. Um arquivo só fica pronto
+    depois de uma varredura inteira sem mudar de tamanho nem de mtime,
+    para não ler arquivos que ainda estão sendo copiados."""
+    present = set()
+    for path in resolve_sources(inbox):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        present.add(path)
+        known = files.get(path)
+        if known is None:
+            files[path] = InboxFile(stat.st_size, stat.st_mtime_ns, now)
+        elif (known.size, known.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            known.size, known.mtime_ns, known.ready_at = stat.st_size, stat.st_mtime_ns, None
+        elif known.ready_at is None:
+            known.ready_at = now
+    for path in set(files) - present:
+        del files[path]
+
+
+def take_batch(
+    files: dict[Path, InboxFile], now: float, window: float, max_bytes: int
+) -> list[Path]:
+    """Fecha um lote com os arquivos prontos quando eles somam max_bytes
+    ou quando o mais antigo já esperou `window` segundos.
+    Retorna a lista do lote (vazia se ainda não é hora)."""
+    ready = sorted((f.ready_at, p) for p, f in files.items() if f.ready_at is not None)
+    if not ready:
+        return []
+    total = sum(files[p].size for _, p in ready)
+    if total < max_bytes and now - ready[0][0] < window:
+        return []
+
+    batch, size = [], 0
+    for _, path in ready:
+        if batch and size + files[path].size > max_bytes:
+            break
+        batch.append(path)
+        size += files[path].size
+    return batch
+
+
+def move_to(path: Path, directory: Path) -> Path:
+    """Move o arquivo para directory/AAAA-MM-DD/, sem sobrescrever
+    um arquivo de mesmo nome que já esteja lá."""
+    target_dir = directory / f"{datetime.now():%Y-%m-%d}"
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / path.name
+    if target.exists():
+        target = target_dir / f"{datetime.now():%H%M%S%f}_{path.name}"
+    return Path(shutil.move(str(path), str(target)))
+
+
+class WorkerPool:
+    """Pool de processos do daemon. Se um processo morre (falta de memória,
+    segfault), o ProcessPoolExecutor fica quebrado para sempre; aqui ele é
+    trocado por um novo."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def rebuild(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        print("Pool de processos recriado", file=sys.stderr)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+def load_batch(
+    inbox: Path,
+    batch: list[Path],
+    archive: Path,
+    errors: Path,
+    workers: int,
+    connections: int,
+    processes: WorkerPool,
+) -> bool:
+    """Carrega um lote e move cada arquivo para arquivados ou erro.
+    Os arquivos são sempre lidos inteiros (force): na pasta de entrada
+    cada arquivo que chega é uma entrega nova, mesmo que repita o nome.
+    Se o pool de processos quebra, ele é recriado e os arquivos afetados
+    são tentados mais uma vez; se quebrar de novo, vão para a pasta de erro.
+    Retorna False se o lote falhou por inteiro (os arquivos ficam na pasta)."""
+    failed: set[Path] = set()
+    pending = batch
+    for attempt in range(2):
+        try:
+            run_many(f"{inbox} ({len(pending)} arquivos)", workers, connections,
+                     force=True, paths=pending, processes=processes.executor)
+            pending = []
+        except FilesFailedError as exc:
+            failed |= set(exc.failed) - set(exc.broken)
+            pending = exc.broken
+        except Exception as exc:
+            print(f"Lote falhou, nova tentativa em {_RETRY_DELAY:.0f}s: {exc}", file=sys.stderr)
+            # Os arquivos já resolvidos na primeira tentativa saem da pasta
+            for path in set(batch) - set(pending):
+                move_to(path, errors if path in failed else archive)
+            return False
+        if not pending:
+            break
+        processes.rebuild()
+    failed |= set(pending)
+
+    for path in batch:
+        move_to(path, errors if path in failed else archive)
+    return True
+
+
+def watch(
+    inbox: Path,
+    archive: Path,
+    errors: Path,
+    window: float = ETL_DAEMON_WINDOW,
+    max_bytes: int = ETL_DAEMON_MAX_BYTES,
+    poll: float = ETL_DAEMON_POLL,
+    workers: int = ETL_WORKERS,
+    connections: int = ETL_DB_CONNECTIONS,
+    stop: threading.Event | None = None,
+) -> None:
+    """Vigia a pasta até `stop` ser acionado, carregando os lotes que se
+    formam. O lote em andamento sempre termina antes de sair."""
+    stop = stop or threading.Event()
+    files: dict[Path, InboxFile] = {}
+    print(f"Vigiando {inbox} (janela {window}s, lote ate {max_bytes / 1e6:,.0f} MB)")
+
+    processes = WorkerPool(workers)
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            scan(inbox, files, now)
+            batch = take_batch(files, now, window, max_bytes)
+            if not batch:
+                stop.wait(poll)
+                continue
+
+            arrived = min(files[p].seen_at for p in batch)
+            if not load_batch(inbox, batch, archive, errors, workers, connections, processes):
+                stop.wait(_RETRY_DELAY)
+                continue
+            for path in batch:
+                files.pop(path, None)
+            print(f"Lote de {len(batch)} arquivos carregado "
+                  f"{time.monotonic() - arrived:.1f}s depois da chegada")
+    finally:
+        processes.shutdown()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Interpreta a linha de comando e inicia o daemon."""
+    parser = argparse.ArgumentParser(description="Daemon do ETL para uma pasta de entrada")
+    parser.add_argument("inbox", help="pasta vigiada")
+    parser.add_argument("--archive", default=None,
+                        help="para onde vão os arquivos carregados (padrão: PASTA/arquivados)")
+    parser.add_argument("--errors", default=None,
+                        help="para onde vão os arquivos que falharam (padrão: PASTA/erro)")
+    parser.add_argument("--window", type=float, default=ETL_DAEMON_WINDOW,
+                        help="segundos que um arquivo pronto espera outros para formar o lote")
+    parser.add_argument("--max-bytes", type=int, default=ETL_DAEMON_MAX_BYTES,
+                        help="tamanho que fecha o lote na hora")
+    parser.add_argument("--poll", type=float, default=ETL_DAEMON_POLL,
+                        help="segundos entre varreduras da pasta")
+    parser.add_argument("--workers", type=int, default=ETL_WORKERS,
+                        help="processos de transformação")
+    parser.add_argument("--connections", type=int, default=ETL_DB_CONNECTIONS,
+                        help="conexões de carga simultâneas")
+    args = parser.parse_args(argv)
+
+    inbox = Path(args.inbox)
+    if not inbox.is_dir():
+        parser.error(f"{inbox} nao e um diretorio")
+
+    # SIGINT/SIGTERM terminam o lote em andamento e saem
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    watch(
+        inbox,
+        Path(args.archive) if args.archive else inbox / "arquivados",
+        Path(args.errors) if args.errors else inbox / "erro",
+        args.window, args.max_bytes, args.poll, args.workers, args.connections, stop,
+    )
+
+
+if __name__ == "__main__":
+    main()
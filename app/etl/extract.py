@@ -1,11 +1,352 @@
-# Leitura de arquivos CSV.
+# Leitura dos arquivos de vendas (CSV, Parquet e Arrow IPC).
 # Esse módulo é o ponto de entrada dos dados brutos no pipeline ETL.
+# O CSV é lido com o parser multi-thread do pyarrow e um schema fixo,
+# derivado das colunas obrigatórias de transform.REQUIRED_COLUMNS.
+# CSVs comprimidos (gzip, zstd, bz2) são descomprimidos durante a leitura.
 
+import csv
+import io
 from pathlib import Path
+from typing import Iterator
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.ipc as paipc
+import pyarrow.parquet as pq
+
+from app.etl.transform import REQUIRED_COLUMNS
+
+# Colunas de texto com poucos valores distintos viram categóricas
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+_TYPES = {
+    "sale_date": pa.timestamp("ns"),
+    "store_name": _CATEGORY,
+    "city": _CATEGORY,
+    "state": _CATEGORY,
+    "sku": _CATEGORY,
+    "product_name": _CATEGORY,
+    "category": _CATEGORY,
+    "quantity": pa.int32(),
+    "unit_price": pa.float64(),
+    "discount": pa.float64(),
+}
+
+# Schema fixo das colunas obrigatórias (colunas extras continuam sendo inferidas)
+COLUMN_TYPES: dict[str, pa.DataType] = {c: _TYPES[c] for c in REQUIRED_COLUMNS}
+
+# Mesmos marcadores de nulo que o pd.read_csv reconhece por padrão
+NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# Formato de cada extensão de arquivo aceita
+FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+
+# Extensões de compressão aceitas (ex.: vendas.csv.gz)
+COMPRESSIONS = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+    ".zstd": "zstd",
+    ".bz2": "bz2",
+}
+
+# Bytes iniciais de cada formato de compressão
+_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"BZh": "bz2",
+}
+
+# Buffer de leitura do fluxo descomprimido
+_STREAM_BUFFER = 1 << 20
+
+
+def compression(path: str | Path) -> str | None:
+    """Descobre a compressão do arquivo pela extensão ou, na falta dela,
+    pelos primeiros bytes. Retorna None para arquivos sem compressão."""
+    suffix = Path(path).suffix.lower()
+    if suffix in COMPRESSIONS:
+        return COMPRESSIONS[suffix]
+    if suffix not in FORMATS:
+        return None
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for magic, codec in _MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def source_format(path: str | Path) -> str:
+    """Descobre o formato do arquivo pela extensão (ignorando a de compressão)."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix in COMPRESSIONS:
+        suffix = Path(path.stem).suffix.lower()
+    if suffix not in FORMATS:
+        raise ValueError(f"Formato de arquivo não suportado: {path}")
+    return FORMATS[suffix]
 
 
-def read_csv(path: str | Path) -> pd.DataFrame:
-    """Lê um arquivo CSV e converte a coluna sale_date para datetime."""
-    df = pd.read_csv(path, parse_dates=["sale_date"])
+def _to_frame(table: pa.Table) -> pd.DataFrame:
+    """Converte uma tabela Arrow em DataFrame.
+    Nulos de texto viram NaN, como no pd.read_csv, para que o hash das
+    linhas continue igual ao gerado com o parser do pandas."""
+    df = table.to_pandas()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].notna(), np.nan)
     return df
+
+
+def _conform(table: pa.Table) -> pa.Table:
+    """Aplica o schema fixo em tabelas vindas de Parquet/Arrow."""
+    for name, target in COLUMN_TYPES.items():
+        if name not in table.column_names:
+            continue
+        i = table.column_names.index(name)
+        col = table.column(i)
+        if col.type == target:
+            continue
+        if pa.types.is_dictionary(target):
+            col = col.cast(pa.string()).dictionary_encode()
+        else:
+            col = col.cast(target)
+        table = table.set_column(i, name, col)
+    return table
+
+
+# --- CSV ---------------------------------------------------------------
+
+class _BoundedFile(io.RawIOBase):
+    """Arquivo visto só até o byte `end`: o que for gravado depois disso
+    (arquivo crescendo durante a carga) fica para a próxima execução."""
+
+    def __init__(self, f, end: int):
+        self._f = f
+        self._end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), max(self._end - self._f.tell(), 0))
+        return self._f.readinto(memoryview(b)[:n]) if n else 0
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        return self._f.seek(pos, whence)
+
+    def tell(self) -> int:
+        return self._f.tell()
+
+    def close(self) -> None:
+        self._f.close()
+        super().close()
+
+
+def _open_binary(path: str | Path, end: int | None = None):
+    """Abre o arquivo em modo binário, descomprimindo em fluxo se preciso.
+    Nada é gravado em disco: o conteúdo é descomprimido à medida que é lido.
+    Com `end`, um arquivo sem compressão é lido só até esse byte."""
+    codec = compression(path)
+    if codec is None:
+        if end is not None:
+            return io.BufferedReader(_BoundedFile(open(path, "rb", buffering=0), end), _STREAM_BUFFER)
+        return open(path, "rb")
+    stream = pa.CompressedInputStream(pa.OSFile(str(path)), codec)
+    return io.BufferedReader(stream, _STREAM_BUFFER)
+
+
+def _header(path: str | Path) -> list[str]:
+    """Lê só a linha de cabeçalho do CSV."""
+    with _open_binary(path) as f:
+        line = f.readline().decode("utf-8-sig")
+    return next(csv.reader([line]))
+
+
+def _parse_csv(source, header: list[str], strict: bool = True) -> pd.DataFrame:
+    """Converte bytes de CSV (sem cabeçalho) em DataFrame com o schema fixo.
+    Com strict=False, datas e números ficam como texto: um valor inválido
+    não derruba o bloco inteiro e a linha é rejeitada depois, em
+    transform.split_rejected."""
+    types = {c: t for c, t in COLUMN_TYPES.items() if c in header}
+    if not strict:
+        types = {c: t if pa.types.is_dictionary(t) else pa.string() for c, t in types.items()}
+    table = pacsv.read_csv(
+        source,
+        read_options=pacsv.ReadOptions(column_names=header),
+        convert_options=pacsv.ConvertOptions(
+            column_types=types,
+            null_values=NULL_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+    return _to_frame(table)
+
+
+def _parse_buffer(data: pa.Buffer, header: list[str]) -> pd.DataFrame:
+    """Converte um bloco de CSV com o schema fixo; se algum valor não
+    converte, relê o bloco com datas e números como texto."""
+    try:
+        return _parse_csv(data, header)
+    except pa.ArrowInvalid:
+        return _parse_csv(data, header, strict=False)
+
+
+def _open_data(path: str | Path, offset: int, end: int | None = None):
+    """Abre o CSV em modo binário já posicionado no primeiro byte de dados:
+    logo depois do cabeçalho ou no offset pedido (usado para ler só o
+    final de arquivos que cresceram desde a última carga).
+    Em arquivos comprimidos o offset conta bytes já descomprimidos
+    e é alcançado lendo e descartando o começo do fluxo.
+    Com `end`, a leitura para nesse byte (só em arquivos sem compressão).
+    Retorna (arquivo, byte em que a leitura começa)."""
+    f = _open_binary(path, end)
+    position = len(f.readline())
+    if offset > position:
+        if f.seekable():
+            f.seek(offset)
+            position = offset
+        else:
+            while position < offset:
+                position += len(f.read(min(_STREAM_BUFFER, offset - position)))
+    return f, position
+
+
+def read_csv(path: str | Path, offset: int = 0, end: int | None = None) -> pd.DataFrame:
+    """Lê um arquivo CSV inteiro (do offset até end) com o schema fixo."""
+    header = _header(path)
+    f, _ = _open_data(path, offset, end)
+    with f:
+        if not f.peek(1):
+            # Arquivo só com cabeçalho: o pyarrow não aceita entrada vazia
+            return _parse_csv(pa.py_buffer(b"\n"), header)
+        try:
+            return _parse_csv(f, header)
+        except pa.ArrowInvalid:
+            pass
+    # Algum valor não converte: relê com datas e números como texto
+    f, _ = _open_data(path, offset, end)
+    with f:
+        return _parse_csv(f, header, strict=False)
+
+
+def _read_records(f, count: int) -> list[bytes]:
+    """Lê as próximas `count` linhas do arquivo sem cortar um registro ao
+    meio: se a última linha deixou um campo entre aspas aberto (quebra de
+    linha dentro do campo), continua lendo até o registro fechar.
+    Aspas escapadas ("") não mudam a paridade, então basta contá-las."""
+    lines, quotes = [], 0
+    for line in f:
+        lines.append(line)
+        quotes += line.count(b'"')
+        if len(lines) >= count and quotes % 2 == 0:
+            break
+    return lines
+
+
+def _csv_blocks(
+    path: str | Path, chunk_size: int, offset: int = 0, end: int | None = None
+) -> Iterator[tuple[pd.DataFrame, int]]:
+    """Lê o CSV em blocos de chunk_size linhas, junto com o byte em que
+    cada bloco termina. As linhas de cada bloco são separadas no arquivo,
+    sempre em fim de registro, e o parser do pyarrow converte o bloco
+    inteiro de uma vez. Com chunk_size=0 o arquivo inteiro vem num bloco só.
+    Com `end`, só os bytes até end são lidos."""
+    header = _header(path)
+    f, position = _open_data(path, offset, end)
+    with f:
+        if chunk_size <= 0:
+            data = f.read()
+            # Arquivo só com cabeçalho: o pyarrow não aceita entrada vazia
+            yield _parse_buffer(pa.py_buffer(data or b"\n"), header), position + len(data)
+            return
+        while lines := _read_records(f, chunk_size):
+            data = b"".join(lines)
+            position += len(data)
+            if data.strip():
+                yield _parse_buffer(pa.py_buffer(data), header), position
+
+
+# --- Parquet / Arrow IPC -----------------------------------------------
+
+def _read_table(path: str | Path) -> pa.Table:
+    """Lê um arquivo Parquet ou Arrow IPC como tabela (Arrow via memory map)."""
+    if source_format(path) == "parquet":
+        return pq.read_table(path)
+    return paipc.open_file(pa.memory_map(str(path))).read_all()
+
+
+def _table_chunks(path: str | Path, chunk_size: int) -> Iterator[pa.Table]:
+    """Lê Parquet/Arrow em blocos de até chunk_size linhas."""
+    if source_format(path) == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield pa.Table.from_batches([batch])
+        return
+    table = _read_table(path)
+    for start in range(0, table.num_rows, chunk_size):
+        yield table.slice(start, chunk_size)
+
+
+def _table_blocks(path: str | Path, chunk_size: int, start_row: int = 0) -> Iterator[tuple[pa.Table, int]]:
+    """Lê Parquet/Arrow em blocos a partir da linha start_row, junto com
+    o número da linha em que cada bloco termina."""
+    if chunk_size <= 0:
+        table = _read_table(path)
+        yield table.slice(start_row), table.num_rows
+        return
+    row = 0
+    for table in _table_chunks(path, chunk_size):
+        end = row + table.num_rows
+        if end > start_row:
+            yield table.slice(max(start_row - row, 0)), end
+        row = end
+
+
+# --- Entrada genérica --------------------------------------------------
+
+def read_file(path: str | Path, offset: int = 0, end: int | None = None) -> pd.DataFrame:
+    """Lê um arquivo de vendas inteiro, escolhendo o leitor pela extensão.
+    O offset e o end (último byte lido) só valem para CSV."""
+    if source_format(path) == "csv":
+        return read_csv(path, offset, end)
+    return _to_frame(_conform(_read_table(path)))
+
+
+def read_file_blocks(
+    path: str | Path, chunk_size: int, position: int = 0, end: int | None = None
+) -> Iterator[tuple[pd.DataFrame, int]]:
+    """Lê um arquivo de vendas em blocos de chunk_size linhas, junto com a
+    posição em que cada bloco termina: o byte do arquivo no CSV (contado
+    já descomprimido) ou o número da linha no Parquet/Arrow.
+    Passar essa posição de volta retoma a leitura logo depois do bloco.
+    Com `end` (fim da última linha completa do CSV sem compressão, visto
+    no planejamento), o que for gravado depois dele fica para a próxima
+    execução."""
+    if source_format(path) == "csv":
+        yield from _csv_blocks(path, chunk_size, position, end)
+    else:
+        for table, row in _table_blocks(path, chunk_size, position):
+            yield _to_frame(_conform(table)), row
+
+
+def read_file_chunks(path: str | Path, chunk_size: int, offset: int = 0) -> Iterator[pd.DataFrame]:
+    """Lê um arquivo de vendas em blocos de chunk_size linhas.
+    Com chunk_size=0 o arquivo inteiro vem num bloco só."""
+    for df, _ in read_file_blocks(path, chunk_size, offset):
+        yield df
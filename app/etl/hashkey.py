@@ -0,0 +1,171 @@
+# Formato da chave de deduplicação (fato_vendas.hash_origem).
+# O formato padrão guarda o SHA-256 da linha em 64 caracteres hex (TEXT).
+# Os formatos compactos guardam um prefixo do mesmo SHA-256: 16 bytes em
+# BYTEA ou 8 bytes em BIGINT. O índice único fica bem menor, o ON CONFLICT
+# compara menos bytes e cada linha enviada ao banco fica mais curta.
+# A unicidade continua sendo por (hash_origem, data_venda): uma colisão
+# só importa entre vendas do mesmo dia.
+#
+# Uso: python -m app.etl.hashkey [--check int64] [--migrate bytea|int64]
+
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.api.db import SessionLocal
+from app.config import ETL_HASH_MODE
+from app.etl.rollup import bump_data_version
+from app.etl.transform import HASH_MODES
+
+# Tipo da coluna hash_origem em cada formato
+SQL_TYPES = {"hex": "TEXT", "bytea": "BYTEA", "int64": "BIGINT"}
+
+# Bits de hash guardados em cada formato
+BITS = {"hex": 256, "bytea": 128, "int64": 64}
+
+# Expressão que converte a coluna de um formato para outro, calculando o
+# mesmo prefixo que transform.row_hashes gera. Só é possível encurtar.
+CONVERSIONS = {
+    ("hex", "bytea"): "decode(substr(hash_origem, 1, 32), 'hex')",
+    ("hex", "int64"): "('x' || substr(hash_origem, 1, 16))::bit(64)::bigint",
+    ("bytea", "int64"): "('x' || encode(substring(hash_origem from 1 for 8), 'hex'))::bit(64)::bigint",
+}
+
+# Formato já conferido neste processo
+_checked: str | None = None
+
+
+def column_mode(session: Session) -> str:
+    """Formato atual da coluna hash_origem, pelo tipo no banco."""
+    data_type = session.execute(text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'fato_vendas' AND column_name = 'hash_origem'
+          AND table_schema = current_schema();
+    """)).scalar_one()
+    modes = {"text": "hex", "bytea": "bytea", "bigint": "int64"}
+    if data_type not in modes:
+        raise RuntimeError(f"Tipo inesperado para fato_vendas.hash_origem: {data_type}")
+    return modes[data_type]
+
+
+def check_hash_mode(session: Session, mode: str = ETL_HASH_MODE) -> None:
+    """Confere se o ETL_HASH_MODE bate com o tipo da coluna no banco.
+    Sem isso, a carga falharia no meio do primeiro bloco."""
+    global _checked
+    if _checked == mode:
+        return
+    if mode not in HASH_MODES:
+        raise ValueError(f"ETL_HASH_MODE desconhecido: {mode} (use {', '.join(HASH_MODES)})")
+    current = column_mode(session)
+    if current != mode:
+        raise RuntimeError(
+            f"ETL_HASH_MODE={mode}, mas fato_vendas.hash_origem esta no formato {current}. "
+            f"Ajuste o .env ou rode: python -m app.etl.hashkey --migrate {mode}"
+        )
+    _checked = mode
+
+
+def expected_collisions(rows_per_day: list[int], mode: str) -> float:
+    """Número esperado de pares colidindo (aproximação do aniversário),
+    somado dia a dia, já que a chave única inclui a data."""
+    space = 2.0 ** BITS[mode]
+    return sum(n * (n - 1) / 2 / space for n in rows_per_day)
+
+
+def collision_report(session: Session, mode: str) -> dict:
+    """Mede as colisões que o formato `mode` teria nas vendas já gravadas:
+    linhas com chaves diferentes no formato atual que ficariam com a mesma
+    chave (no mesmo dia) no formato novo. Também traz o valor esperado
+    pela teoria e o tamanho atual da fato e dos seus índices."""
+    current = column_mode(session)
+    report = {"atual": current, "formato": mode}
+
+    if mode == current:
+        report["colisoes"] = 0
+    elif (current, mode) in CONVERSIONS:
+        report["colisoes"] = session.execute(text(f"""
+            SELECT COUNT(*) - COUNT(DISTINCT ({CONVERSIONS[(current, mode)]}, data_venda))
+            FROM fato_vendas;
+        """)).scalar_one()
+    else:
+        report["colisoes"] = None
+
+    per_day = session.execute(
+        text("SELECT COUNT(*) FROM fato_vendas GROUP BY data_venda;")
+    ).scalars().all()
+    report["linhas"] = sum(per_day)
+    report["esperadas"] = expected_collisions(per_day, mode)
+    report["taxa"] = (report["colisoes"] or 0) / report["linhas"] if report["linhas"] else 0.0
+
+    sizes = session.execute(text("""
+        SELECT COALESCE(SUM(pg_table_size(inhrelid)), 0)   AS tabela,
+               COALESCE(SUM(pg_indexes_size(inhrelid)), 0) AS indices
+        FROM pg_inherits
+        WHERE inhparent = 'fato_vendas'::regclass;
+    """)).one()
+    report["tabela_bytes"] = sizes.tabela
+    report["indices_bytes"] = sizes.indices
+    return report
+
+
+def migrate(session: Session, mode: str) -> None:
+    """Converte hash_origem para o formato `mode`, reescrevendo a fato e
+    recriando o índice único (trava a tabela durante a conversão).
+    Recusa a conversão se houver colisões nas vendas já gravadas."""
+    current = column_mode(session)
+    if current == mode:
+        return
+    if (current, mode) not in CONVERSIONS:
+        raise ValueError(f"Conversao de {current} para {mode} nao suportada (so e possivel encurtar)")
+
+    collisions = collision_report(session, mode)["colisoes"]
+    if collisions:
+        raise RuntimeError(
+            f"{collisions} vendas colidiriam no formato {mode}; mantenha o formato {current}"
+        )
+
+    session.execute(text(f"""
+        ALTER TABLE fato_vendas
+        ALTER COLUMN hash_origem TYPE {SQL_TYPES[mode]}
+        USING {CONVERSIONS[(current, mode)]};
+    """))
+    bump_data_version(session)
+    session.commit()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Mostra o formato atual, mede colisões ou migra a coluna."""
+    parser = argparse.ArgumentParser(description="Formato da chave hash_origem")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--check", choices=HASH_MODES, default=None,
+                       help="mede as colisões que o formato teria nas vendas gravadas")
+    group.add_argument("--migrate", choices=HASH_MODES, default=None,
+                       help="converte a coluna para o formato (depois ajuste ETL_HASH_MODE)")
+    args = parser.parse_args(argv)
+
+    session = SessionLocal()
+    try:
+        if args.migrate:
+            before = collision_report(session, args.migrate)
+            migrate(session, args.migrate)
+            after = collision_report(session, args.migrate)
+            print(f"hash_origem convertido de {before['atual']} para {args.migrate}")
+            print(f"  indices: {before['indices_bytes'] / 1e6:,.1f} MB -> {after['indices_bytes'] / 1e6:,.1f} MB")
+            print(f"  tabela:  {before['tabela_bytes'] / 1e6:,.1f} MB -> {after['tabela_bytes'] / 1e6:,.1f} MB")
+            print(f"Defina ETL_HASH_MODE={args.migrate} no .env")
+            return
+
+        report = collision_report(session, args.check or column_mode(session))
+        print(f"Formato atual: {report['atual']}  ({report['linhas']:,} vendas)")
+        print(f"  indices: {report['indices_bytes'] / 1e6:,.1f} MB  tabela: {report['tabela_bytes'] / 1e6:,.1f} MB")
+        if args.check:
+            measured = "-" if report["colisoes"] is None else f"{report['colisoes']} ({report['taxa']:.2e})"
+            print(f"Formato {args.check}: colisoes medidas {measured}, "
+                  f"esperadas {report['esperadas']:.2e}")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,75 +2,188 @@
 # Responsáveis por inserir lojas, produtos e vendas no banco de dados.
 # Usa upsert (INSERT ... ON CONFLICT) para evitar duplicatas.
 
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
 import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+from app.config import ETL_BATCH_SIZE, ETL_HASH_MODE
+from app.etl.hashkey import SQL_TYPES
+from app.etl.metrics import count_round_trip, round_trips
+from app.etl.partitions import partition_name
+
+# Colunas da fato_vendas na ordem usada pelo COPY da tabela temporária
+FACT_COLUMNS = [
+    "data_venda", "loja_id", "produto_id", "quantidade",
+    "preco_unitario", "desconto", "valor_total", "hash_origem",
+]
+
+
+# Cache de chaves das dimensões, compartilhado por todo o processo.
+# Evita idas ao banco para lojas e produtos que já conhecemos.
+_store_cache: dict[str, int] = {}
+_product_cache: dict[str, int] = {}
+_cache_loaded = False
+
+
+def clear_dimension_cache() -> None:
+    """Esvazia o cache de dimensões.
+    Deve ser chamado quando a transação que criou chaves novas sofre rollback."""
+    global _cache_loaded
+    _store_cache.clear()
+    _product_cache.clear()
+    _cache_loaded = False
+
+
+def _load_dimension_cache(session: Session) -> None:
+    """Carrega todas as chaves de dim_loja e dim_produto uma única vez."""
+    global _cache_loaded
+    if _cache_loaded:
+        return
+    _store_cache.update(
+        session.execute(text("SELECT nome_loja, loja_id FROM dim_loja")).all()
+    )
+    _product_cache.update(
+        session.execute(text("SELECT sku, produto_id FROM dim_produto")).all()
+    )
+    _cache_loaded = True
+
+
+def _column_values(df: pd.DataFrame, column: str) -> list:
+    """Converte uma coluna em lista Python, trocando NaN por None."""
+    return [None if pd.isna(v) else v for v in df[column].tolist()]
+
 
 def upsert_stores(session: Session, df: pd.DataFrame) -> dict[str, int]:
     """Insere ou busca lojas no banco e retorna um mapa nome -> id.
-    Se a loja já existir, apenas busca o ID dela."""
-    stores = df[["store_name", "city", "state"]].drop_duplicates()
-    mapping: dict[str, int] = {}
+    Lojas novas entram num único INSERT multi-linha e os IDs
+    são buscados numa única consulta; as conhecidas vêm do cache."""
+    _load_dimension_cache(session)
+    stores = df[["store_name", "city", "state"]].drop_duplicates("store_name")
+    missing = stores[~stores["store_name"].isin(_store_cache.keys())]
 
-    for _, row in stores.iterrows():
-        # Tenta inserir a loja; se já existir, ignora
-        result = session.execute(
+    if not missing.empty:
+        names = _column_values(missing, "store_name")
+        # Insere todas as lojas novas de uma vez; as que já existem são ignoradas
+        session.execute(
             text("""
                 INSERT INTO dim_loja (nome_loja, cidade, estado)
-                VALUES (:store_name, :city, :state)
-                ON CONFLICT (nome_loja) DO NOTHING
-                RETURNING loja_id;
+                SELECT * FROM unnest(
+                    CAST(:names AS TEXT[]), CAST(:cities AS TEXT[]), CAST(:states AS TEXT[])
+                )
+                ON CONFLICT (nome_loja) DO NOTHING;
             """),
-            dict(row),
+            {
+                "names": names,
+                "cities": _column_values(missing, "city"),
+                "states": _column_values(missing, "state"),
+            },
+        )
+        # Busca os IDs de todas elas (novas ou não) numa consulta só
+        _store_cache.update(
+            session.execute(
+                text("SELECT nome_loja, loja_id FROM dim_loja WHERE nome_loja = ANY(:names)"),
+                {"names": names},
+            ).all()
         )
-        new = result.fetchone()
-
-        if new:
-            # Loja nova inserida com sucesso
-            mapping[row["store_name"]] = new[0]
-        else:
-            # Loja já existia, precisamos buscar o ID
-            existing = session.execute(
-                text("SELECT loja_id FROM dim_loja WHERE nome_loja = :store_name"),
-                {"store_name": row["store_name"]},
-            ).fetchone()
-            mapping[row["store_name"]] = existing[0]
 
-    return mapping
+    return {name: _store_cache[name] for name in stores["store_name"]}
 
 
 def upsert_products(session: Session, df: pd.DataFrame) -> dict[str, int]:
     """Insere ou busca produtos no banco e retorna um mapa sku -> id.
-    Se o produto já existir (mesmo SKU), apenas busca o ID."""
-    products = df[["sku", "product_name", "category"]].drop_duplicates()
-    mapping: dict[str, int] = {}
+    Mesma estratégia do upsert_stores: um INSERT multi-linha para os
+    SKUs novos, uma consulta para os IDs e cache para os conhecidos."""
+    _load_dimension_cache(session)
+    products = df[["sku", "product_name", "category"]].drop_duplicates("sku")
+    missing = products[~products["sku"].isin(_product_cache.keys())]
 
-    for _, row in products.iterrows():
-        # Tenta inserir o produto; se o SKU já existir, ignora
-        result = session.execute(
+    if not missing.empty:
+        skus = _column_values(missing, "sku")
+        # Insere todos os produtos novos de uma vez; SKUs existentes são ignorados
+        session.execute(
             text("""
                 INSERT INTO dim_produto (sku, nome_produto, categoria)
-                VALUES (:sku, :product_name, :category)
-                ON CONFLICT (sku) DO NOTHING
-                RETURNING produto_id;
+                SELECT * FROM unnest(
+                    CAST(:skus AS TEXT[]), CAST(:names AS TEXT[]), CAST(:categories AS TEXT[])
+                )
+                ON CONFLICT (sku) DO NOTHING;
             """),
-            dict(row),
+            {
+                "skus": skus,
+                "names": _column_values(missing, "product_name"),
+                "categories": _column_values(missing, "category"),
+            },
+        )
+        # Busca os IDs de todos os SKUs do lote numa consulta só
+        _product_cache.update(
+            session.execute(
+                text("SELECT sku, produto_id FROM dim_produto WHERE sku = ANY(:skus)"),
+                {"skus": skus},
+            ).all()
         )
-        new = result.fetchone()
 
-        if new:
-            # Produto novo inserido
-            mapping[row["sku"]] = new[0]
-        else:
-            # Produto já existia, buscamos o ID
-            existing = session.execute(
-                text("SELECT produto_id FROM dim_produto WHERE sku = :sku"),
-                {"sku": row["sku"]},
-            ).fetchone()
-            mapping[row["sku"]] = existing[0]
+    return {sku: _product_cache[sku] for sku in products["sku"]}
+
+
+def quarantine_rows(
+    session: Session, run_id: int, chunk: int | None, rejected: pd.DataFrame
+) -> int:
+    """Grava as linhas rejeitadas pelas regras do transform em etl_quarentena,
+    com o motivo e os valores originais (JSON), num único INSERT.
+    Não faz commit: entra na transação do bloco.
+    Retorna quantas linhas foram gravadas."""
+    if rejected.empty:
+        return 0
+    # Um registro por linha: separa só no "\n" (quebras dentro dos textos saem
+    # escapadas, mas U+2028, U+0085 etc. não, e splitlines() quebraria neles)
+    rows = rejected.drop(columns="motivo").to_json(
+        orient="records", lines=True, date_format="iso", force_ascii=False
+    ).rstrip("\n").split("\n")
+    assert len(rows) == len(rejected), "JSON da quarentena fora de sincronia com os motivos"
+    session.execute(
+        text("""
+            INSERT INTO etl_quarentena (execucao_id, bloco, motivo, linha)
+            SELECT :execucao_id, :bloco, motivo, linha
+            FROM unnest(CAST(:motivos AS TEXT[]), CAST(:linhas AS JSONB[])) AS q (motivo, linha);
+        """),
+        {
+            "execucao_id": run_id,
+            "bloco": chunk,
+            "motivos": rejected["motivo"].tolist(),
+            "linhas": rows,
+        },
+    )
+    return len(rows)
+
 
-    return mapping
+def drop_known_facts(session: Session, df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """Pré-filtro de duplicatas feito no cliente, antes de enviar as vendas.
+    1. Colapsa linhas repetidas dentro do próprio lote (mesmo hash)
+    2. Busca os hash_origem já gravados no intervalo de datas do lote
+       e descarta as linhas que já estão no banco
+    Retorna (DataFrame só com linhas novas, quantidade descartada)."""
+    unique = df.drop_duplicates("source_row_hash")
+
+    dates = unique["sale_date"].dropna()
+    if dates.empty:
+        return unique, len(df) - len(unique)
+
+    # O hash inclui a data da venda, então basta olhar o intervalo do lote
+    existing = session.execute(
+        text("""
+            SELECT hash_origem FROM fato_vendas
+            WHERE data_venda BETWEEN :start AND :end;
+        """),
+        {"start": dates.min().date(), "end": dates.max().date()},
+    ).scalars().all()
+
+    new = unique[~unique["source_row_hash"].isin(existing)]
+    return new, len(df) - len(new)
 
 
 def insert_facts(
@@ -94,7 +207,7 @@ def insert_facts(
                 VALUES
                     (:sale_date, :store_id, :product_id, :quantity,
                      :unit_price, :discount, :total_amount, :source_row_hash)
-                ON CONFLICT (hash_origem) DO NOTHING;
+                ON CONFLICT (hash_origem, data_venda) DO NOTHING;
             """),
             {
                 "sale_date": row["sale_date"],
@@ -104,7 +217,7 @@ def insert_facts(
                 "unit_price": float(row["unit_price"]),
                 "discount": float(row["discount"]),
                 "total_amount": float(row["total_amount"]),
-                "source_row_hash": row["source_row_hash"],
+                "source_row_hash": _hash_param(row["source_row_hash"]),
             },
         )
 
@@ -114,3 +227,193 @@ def insert_facts(
             skipped += 1
 
     return inserted, skipped
+
+
+def _hash_param(value):
+    """Chave de deduplicação como parâmetro do psycopg (numpy -> int)."""
+    return int(value) if isinstance(value, np.integer) else value
+
+
+def _copy_hashes(hashes: pd.Series) -> pd.Series:
+    """Chaves no formato texto do COPY: bytes viram o literal bytea \\x..."""
+    if ETL_HASH_MODE != "bytea":
+        return hashes
+    return pd.Series(["\\x" + h.hex() for h in hashes], index=hashes.index, dtype=object)
+
+
+def _raw_connection(session: Session):
+    """Retorna a conexão psycopg por baixo da sessão do SQLAlchemy.
+    Necessária para usar a API de COPY do psycopg 3."""
+    return session.connection().connection.driver_connection
+
+
+def _facts_frame(
+    df: pd.DataFrame,
+    store_map: dict[str, int],
+    product_map: dict[str, int],
+) -> pd.DataFrame:
+    """Monta o DataFrame no formato da fato_vendas (ids já resolvidos)."""
+    return pd.DataFrame({
+        "data_venda": df["sale_date"],
+        "loja_id": df["store_name"].map(store_map).astype("int64"),
+        "produto_id": df["sku"].map(product_map).astype("int64"),
+        "quantidade": df["quantity"],
+        "preco_unitario": df["unit_price"],
+        "desconto": df["discount"],
+        "valor_total": df["total_amount"],
+        "hash_origem": _copy_hashes(df["source_row_hash"]),
+    })
+
+
+def bulk_insert_facts(
+    session: Session,
+    df: pd.DataFrame,
+    store_map: dict[str, int],
+    product_map: dict[str, int],
+    batch_size: int = ETL_BATCH_SIZE,
+) -> tuple[int, int]:
+    """Carrega as vendas em lote: cada lote vai via COPY para uma tabela
+    temporária e depois um único INSERT ... SELECT leva tudo para a fato.
+    As vendas são separadas por mês e cada lote vai direto para a partição
+    do seu mês (ver partitions.ensure_partitions, que deve ter rodado antes).
+    Duplicatas (mesmo hash) continuam sendo ignoradas pelo ON CONFLICT.
+    Retorna (inseridas, ignoradas), igual ao insert_facts."""
+    inserted = 0
+    skipped = 0
+
+    if df["sale_date"].isna().any():
+        raise ValueError("Vendas sem data nao podem ser carregadas na fato_vendas")
+
+    # Tabela temporária de staging; some sozinha no commit da transação
+    # (hash_origem no tipo do formato configurado em ETL_HASH_MODE)
+    session.execute(text(f"""
+        CREATE TEMP TABLE IF NOT EXISTS stg_fato_vendas (
+            data_venda     DATE,
+            loja_id        BIGINT,
+            produto_id     BIGINT,
+            quantidade     INTEGER,
+            preco_unitario NUMERIC(12, 2),
+            desconto       NUMERIC(12, 2),
+            valor_total    NUMERIC(14, 2),
+            hash_origem    {SQL_TYPES[ETL_HASH_MODE]}
+        ) ON COMMIT DROP;
+    """))
+    raw = _raw_connection(session)
+
+    months = df["sale_date"].dt.to_period("M")
+    for month, month_df in df.groupby(months, sort=True):
+        inserted_month, skipped_month = _copy_partition(
+            session, raw, partition_name(month.start_time.date()),
+            _facts_frame(month_df, store_map, product_map), batch_size,
+        )
+        inserted += inserted_month
+        skipped += skipped_month
+
+    return inserted, skipped
+
+
+def _copy_partition(
+    session: Session, raw, partition: str, facts: pd.DataFrame, batch_size: int
+) -> tuple[int, int]:
+    """Carrega as vendas de um mês na sua partição, lote a lote.
+    Retorna (inseridas, ignoradas)."""
+    inserted = 0
+    skipped = 0
+
+    for start in range(0, len(facts), batch_size):
+        batch = facts.iloc[start:start + batch_size]
+
+        # Serializa o lote em CSV na memória
+        # (%.15g reproduz a conversão float -> numeric do INSERT por linha)
+        buffer = io.StringIO()
+        batch.to_csv(buffer, index=False, header=False,
+                     date_format="%Y-%m-%d", float_format="%.15g")
+
+        session.execute(text("TRUNCATE stg_fato_vendas;"))
+        with raw.cursor() as cur:
+            with cur.copy(
+                f"COPY stg_fato_vendas ({', '.join(FACT_COLUMNS)}) FROM STDIN (FORMAT csv)"
+            ) as copy:
+                copy.write(buffer.getvalue())
+        count_round_trip()
+
+        # Um único INSERT por lote, direto na partição do mês;
+        # o rowcount diz quantas linhas entraram
+        result = session.execute(text(f"""
+            INSERT INTO {partition} ({', '.join(FACT_COLUMNS)})
+            SELECT {', '.join(FACT_COLUMNS)} FROM stg_fato_vendas
+            ON CONFLICT (hash_origem, data_venda) DO NOTHING;
+        """))
+        inserted += result.rowcount
+        skipped += len(batch) - result.rowcount
+
+    return inserted, skipped
+
+
+def shard_by_date(df: pd.DataFrame, shards: int) -> list[pd.DataFrame]:
+    """Divide as vendas em até `shards` faixas contíguas de datas, com
+    quantidades de linhas parecidas. Um dia nunca é dividido: como o hash
+    inclui a data, linhas repetidas sempre caem na mesma faixa."""
+    days = df["sale_date"].dt.normalize()
+    counts = days.value_counts().sort_index()
+    # Vendas sem data ficam num bloco só, para o carregador recusá-las
+    if shards <= 1 or len(counts) <= 1 or days.isna().any():
+        return [df]
+
+    # Faixa de cada dia pela posição das suas linhas no total acumulado
+    before = counts.cumsum() - counts
+    bucket = pd.Series(
+        np.minimum(before.to_numpy() * shards // len(df), shards - 1), index=counts.index
+    )
+    groups = df.groupby(days.map(bucket).to_numpy(), sort=True)
+    return [shard for _, shard in groups]
+
+
+def load_sharded(
+    session: Session,
+    df: pd.DataFrame,
+    connections: int,
+    load: Callable[[Session, pd.DataFrame], tuple[int, int]],
+) -> tuple[int, int]:
+    """Carrega as vendas em paralelo, uma faixa de datas por conexão.
+    `load(sessão, faixa)` roda numa thread com sessão própria, tirada do
+    mesmo pool da sessão principal. As faixas só fazem commit quando todas
+    terminam; se uma falha, todas sofrem rollback e o erro é propagado.
+    Os commits não são atômicos entre si, mas repetir o bloco é seguro:
+    o que já entrou é ignorado pelo ON CONFLICT.
+    As lojas e produtos usados precisam já estar commitados (as outras
+    conexões não enxergam a transação da sessão principal).
+    Retorna (inseridas, ignoradas) somadas das faixas."""
+    shards = shard_by_date(df, connections)
+    bind = session.get_bind()
+
+    def run_shard(shard: pd.DataFrame) -> tuple[Session, tuple[int, int] | BaseException, int]:
+        shard_session = Session(bind=bind)
+        trips0 = round_trips()
+        try:
+            result = load(shard_session, shard)
+        except BaseException as exc:
+            result = exc
+        return shard_session, result, round_trips() - trips0
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        outcomes = list(pool.map(run_shard, shards))
+
+    sessions = [o[0] for o in outcomes]
+    errors = [o[1] for o in outcomes if isinstance(o[1], BaseException)]
+    # As idas ao banco das threads entram na conta da etapa de quem chamou
+    count_round_trip(sum(o[2] for o in outcomes))
+    try:
+        if errors:
+            for shard_session in sessions:
+                shard_session.rollback()
+            raise errors[0]
+        for shard_session in sessions:
+            shard_session.commit()
+    finally:
+        for shard_session in sessions:
+            shard_session.close()
+
+    inserted = sum(o[1][0] for o in outcomes)
+    skipped = sum(o[1][1] for o in outcomes)
+    return inserted, skipped
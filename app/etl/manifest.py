@@ -0,0 +1,166 @@
+# Manifesto de arquivos já ingeridos (tabela etl_arquivos).
+# Guarda tamanho, mtime, checksum e até que byte cada arquivo foi lido,
+# para que o orquestrador pule arquivos sem mudança e leia só o final
+# de arquivos que apenas cresceram (append-only).
+
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.etl.extract import compression, source_format
+
+# Tamanho do bloco lido ao calcular o checksum
+_READ_BLOCK = 1 << 20
+
+
+@dataclass
+class FilePlan:
+    """O que fazer com um arquivo nesta execução."""
+    path: Path
+    action: str          # "skip", "touch" (só o mtime mudou), "tail" (só o final) ou "full"
+    offset: int          # byte a partir do qual o arquivo deve ser lido
+    size: int
+    mtime_ns: int
+    checksum: str        # SHA-256 do arquivo até end
+    end: int             # byte até onde o arquivo é lido (fim da última linha completa)
+
+
+def file_key(path: Path) -> str:
+    """Chave do arquivo no manifesto (caminho absoluto)."""
+    return str(path.resolve())
+
+
+def _complete_end(path: Path, size: int) -> int:
+    """Byte logo depois do último "\n" até size. Uma linha final sem "\n"
+    pode estar sendo gravada ainda (ex.: quantidade "25" com só o "2" no
+    disco) e fica de fora da leitura, do checksum e do offset gravado."""
+    with open(path, "rb") as f:
+        pos = size
+        while pos > 0:
+            start = max(pos - _READ_BLOCK, 0)
+            f.seek(start)
+            block = f.read(pos - start)
+            cut = block.rfind(b"\n")
+            if cut >= 0:
+                return start + cut + 1
+            pos = start
+    return 0
+
+
+def _checksums(path: Path, prefix_len: int, size: int) -> tuple[str | None, str]:
+    """Lê o arquivo uma vez e retorna (sha256 dos primeiros prefix_len bytes,
+    sha256 dos primeiros size bytes). O primeiro é None se prefix_len for 0.
+    Bytes gravados depois do stat (arquivo crescendo durante a carga) ficam
+    de fora, como ficam de fora da leitura: entram na próxima execução."""
+    sha = hashlib.sha256()
+    prefix_digest = None
+    read = 0
+    with open(path, "rb") as f:
+        while read < size and (block := f.read(min(_READ_BLOCK, size - read))):
+            if prefix_digest is None and 0 < prefix_len <= read + len(block):
+                cut = prefix_len - read
+                sha.update(block[:cut])
+                prefix_digest = sha.hexdigest()
+                sha.update(block[cut:])
+            else:
+                sha.update(block)
+            read += len(block)
+    return prefix_digest, sha.hexdigest()
+
+
+def fetch_entries(session: Session, paths: list[Path]) -> dict[str, dict]:
+    """Busca no manifesto as entradas de todos os arquivos numa consulta só."""
+    rows = session.execute(
+        text("""
+            SELECT caminho, tamanho_bytes, modificado_em_ns, checksum, offset_bytes
+            FROM etl_arquivos
+            WHERE caminho = ANY(:caminhos);
+        """),
+        {"caminhos": [file_key(p) for p in paths]},
+    )
+    return {r.caminho: dict(r._mapping) for r in rows}
+
+
+def plan_file(path: Path, entry: dict | None) -> FilePlan:
+    """Compara o arquivo com sua entrada no manifesto e decide o que ler.
+    - mesmo tamanho e mtime: pula sem abrir o arquivo
+    - mesmo conteúdo com outro mtime: pula, só atualiza o manifesto
+    - cresceu e o começo é idêntico ao já lido: lê só a partir do offset
+    - qualquer outro caso: lê tudo de novo
+    CSV sem compressão é lido só até a última linha completa; uma linha
+    final sem "\n" entra quando o arquivo chega sem mudança à execução
+    seguinte (aí já não está sendo gravada)."""
+    stat = path.stat()
+    size, mtime_ns = stat.st_size, stat.st_mtime_ns
+
+    # Só CSV sem compressão pode ser lido a partir de um offset
+    # (Parquet, Arrow e arquivos comprimidos são relidos inteiros)
+    appendable = source_format(path) == "csv" and compression(path) is None
+
+    unchanged = entry and entry["tamanho_bytes"] == size and entry["modificado_em_ns"] == mtime_ns
+    if unchanged and (not appendable or entry["offset_bytes"] >= size):
+        return FilePlan(path, "skip", size, size, mtime_ns, entry["checksum"], size)
+    end = size if unchanged or not appendable else _complete_end(path, size)
+    if end == 0:
+        # Nem o cabeçalho está completo: espera o arquivo na próxima execução
+        return FilePlan(path, "skip", 0, size, mtime_ns, "", 0)
+
+    prefix_len = entry["offset_bytes"] if entry and appendable and entry["offset_bytes"] <= end else 0
+    prefix_digest, full_digest = _checksums(path, prefix_len, end)
+
+    if entry and full_digest == entry["checksum"]:
+        # Só o mtime mudou (ex.: touch) ou só entrou uma linha incompleta;
+        # o conteúdo lido é o mesmo
+        return FilePlan(path, "touch", end, size, mtime_ns, full_digest, end)
+    if entry and prefix_len and prefix_digest == entry["checksum"]:
+        return FilePlan(path, "tail", prefix_len, size, mtime_ns, full_digest, end)
+    return FilePlan(path, "full", 0, size, mtime_ns, full_digest, end)
+
+
+def plan_files(session: Session, paths: list[Path]) -> list[FilePlan]:
+    """Gera o plano de leitura de cada arquivo."""
+    entries = fetch_entries(session, paths)
+    return [plan_file(p, entries.get(file_key(p))) for p in paths]
+
+
+def full_plan(path: Path) -> FilePlan:
+    """Plano que ignora o manifesto e lê o arquivo inteiro (--force)."""
+    stat = path.stat()
+    appendable = source_format(path) == "csv" and compression(path) is None
+    end = _complete_end(path, stat.st_size) if appendable else stat.st_size
+    _, checksum = _checksums(path, 0, end)
+    return FilePlan(path, "full", 0, stat.st_size, stat.st_mtime_ns, checksum, end)
+
+
+def record_file(session: Session, plan: FilePlan, run_id: int | None) -> None:
+    """Grava no manifesto o estado do arquivo que acabou de ser carregado.
+    Não faz commit: entra na mesma transação da carga do arquivo.
+    Sem run_id (arquivo só tocado), mantém a execução que o carregou."""
+    session.execute(
+        text("""
+            INSERT INTO etl_arquivos
+                (caminho, tamanho_bytes, modificado_em_ns, checksum,
+                 offset_bytes, execucao_id, atualizado_em)
+            VALUES
+                (:caminho, :tamanho_bytes, :modificado_em_ns, :checksum,
+                 :offset_bytes, :execucao_id, NOW())
+            ON CONFLICT (caminho) DO UPDATE
+            SET tamanho_bytes    = EXCLUDED.tamanho_bytes,
+                modificado_em_ns = EXCLUDED.modificado_em_ns,
+                checksum         = EXCLUDED.checksum,
+                offset_bytes     = EXCLUDED.offset_bytes,
+                execucao_id      = COALESCE(EXCLUDED.execucao_id, etl_arquivos.execucao_id),
+                atualizado_em    = NOW();
+        """),
+        {
+            "caminho": file_key(plan.path),
+            "tamanho_bytes": plan.size,
+            "modificado_em_ns": plan.mtime_ns,
+            "checksum": plan.checksum,
+            "offset_bytes": plan.end,
+            "execucao_id": run_id,
+        },
+    )
@@ -0,0 +1,205 @@
+# Instrumentação do ETL por etapa.
+# Mede tempo, linhas por segundo, pico de memória (RSS) e idas ao banco
+# de cada etapa (leitura, validação, limpeza, hash, dimensões, fatos, agregado), por bloco e
+# no total, e grava tudo na tabela etl_etapas.
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+import pandas as pd
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import ETL_HASH_MODE
+from app.etl.transform import validate, split_rejected, clean, add_hash
+
+try:
+    import resource
+except ImportError:  # Windows não tem o módulo resource
+    resource = None
+
+# Ordem em que as etapas aparecem no relatório
+STAGES = [
+    "remocao", "leitura", "validacao", "limpeza", "hash", "quarentena",
+    "dimensoes", "fatos", "agregado",
+]
+
+# Contador de idas ao banco, separado por thread (cada thread usa sua conexão)
+_counter = threading.local()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    count_round_trip()
+
+
+def count_round_trip(n: int = 1) -> None:
+    """Soma idas ao banco feitas fora do SQLAlchemy (ex.: COPY do psycopg)."""
+    _counter.value = getattr(_counter, "value", 0) + n
+
+
+def round_trips() -> int:
+    """Idas ao banco feitas pela thread atual até agora."""
+    return getattr(_counter, "value", 0)
+
+
+def peak_rss_mb() -> float | None:
+    """Pico de memória residente do processo atual, em MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class RunMetrics:
+    """Acumula as medições de uma execução do ETL."""
+
+    def __init__(self):
+        self.records: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        stage: str,
+        seconds: float,
+        rows: int = 0,
+        chunk: int | None = None,
+        trips: int = 0,
+        rss_mb: float | None = None,
+    ) -> None:
+        """Registra uma medição de etapa (de um bloco)."""
+        with self._lock:
+            self.records.append({
+                "etapa": stage,
+                "bloco": chunk,
+                "segundos": seconds,
+                "linhas": rows,
+                "idas_ao_banco": trips,
+                "pico_rss_mb": rss_mb if rss_mb is not None else peak_rss_mb(),
+            })
+
+    @contextmanager
+    def stage(self, name: str, chunk: int | None = None, rows: int = 0):
+        """Mede o bloco `with`. O chamador pode ajustar info["rows"]."""
+        info = {"rows": rows}
+        t0 = time.perf_counter()
+        trips0 = round_trips()
+        yield info
+        self.add(name, time.perf_counter() - t0, info["rows"], chunk, round_trips() - trips0)
+
+    def timed_chunks(self, blocks: Iterable, first_chunk: int = 0) -> Iterator:
+        """Percorre os blocos (DataFrame, posição) do extrator medindo o
+        tempo de leitura de cada um."""
+        iterator = iter(blocks)
+        index = first_chunk
+        while True:
+            t0 = time.perf_counter()
+            try:
+                block = next(iterator)
+            except StopIteration:
+                return
+            self.add("leitura", time.perf_counter() - t0, len(block[0]), index)
+            yield block
+            index += 1
+
+    def extend(self, measures: list[dict], chunk: int | None = None) -> None:
+        """Registra medições feitas em outro processo (ver timed_transform)."""
+        for m in measures:
+            self.add(m["stage"], m["seconds"], m["rows"], chunk, rss_mb=m["rss_mb"])
+
+    def merge(self, other: "RunMetrics") -> None:
+        """Junta as medições de outra execução (usado no relatório de vários arquivos)."""
+        with self._lock:
+            self.records.extend(other.records)
+
+    def totals(self) -> list[dict]:
+        """Soma as medições por etapa (bloco = None)."""
+        totals: dict[str, dict] = {}
+        for r in self.records:
+            t = totals.setdefault(r["etapa"], {
+                "etapa": r["etapa"], "bloco": None, "segundos": 0.0,
+                "linhas": 0, "idas_ao_banco": 0, "pico_rss_mb": None,
+            })
+            t["segundos"] += r["segundos"]
+            t["linhas"] += r["linhas"]
+            t["idas_ao_banco"] += r["idas_ao_banco"]
+            if r["pico_rss_mb"] is not None:
+                t["pico_rss_mb"] = max(t["pico_rss_mb"] or 0.0, r["pico_rss_mb"])
+        order = {name: i for i, name in enumerate(STAGES)}
+        return sorted(totals.values(), key=lambda t: order.get(t["etapa"], len(order)))
+
+    def save(self, session: Session, run_id: int) -> None:
+        """Grava as medições (por bloco e totais) em etl_etapas.
+        Os totais gravados por uma tentativa anterior da mesma execução
+        (que falhou e foi retomada com --resume) são substituídos pelos
+        desta tentativa; as linhas por bloco de cada tentativa ficam.
+        Não faz commit: entra na transação que fecha a execução."""
+        session.execute(
+            text("DELETE FROM etl_etapas WHERE execucao_id = :execucao_id AND bloco IS NULL;"),
+            {"execucao_id": run_id},
+        )
+        rows = [
+            {
+                **r,
+                "execucao_id": run_id,
+                "linhas_por_seg": r["linhas"] / r["segundos"] if r["segundos"] > 0 else None,
+            }
+            for r in self.records + self.totals()
+        ]
+        if not rows:
+            return
+        session.execute(
+            text("""
+                INSERT INTO etl_etapas
+                    (execucao_id, etapa, bloco, segundos, linhas,
+                     linhas_por_seg, idas_ao_banco, pico_rss_mb)
+                VALUES
+                    (:execucao_id, :etapa, :bloco, :segundos, :linhas,
+                     :linhas_por_seg, :idas_ao_banco, :pico_rss_mb);
+            """),
+            rows,
+        )
+
+    def report(self) -> str:
+        """Tabela de texto com o total de cada etapa."""
+        lines = [
+            f"{'etapa':<10} {'segundos':>9} {'linhas':>10} {'linhas/s':>11} "
+            f"{'idas':>6} {'pico RSS':>9}"
+        ]
+        for t in self.totals():
+            rate = t["linhas"] / t["segundos"] if t["segundos"] > 0 else 0
+            rss = f"{t['pico_rss_mb']:.0f} MB" if t["pico_rss_mb"] is not None else "-"
+            lines.append(
+                f"{t['etapa']:<10} {t['segundos']:>9.3f} {t['linhas']:>10} "
+                f"{rate:>11,.0f} {t['idas_ao_banco']:>6} {rss:>9}"
+            )
+        return "\n".join(lines)
+
+
+def timed_transform(
+    df: pd.DataFrame, hash_mode: str = ETL_HASH_MODE
+) -> tuple[pd.DataFrame, pd.DataFrame, list[dict]]:
+    """Aplica o transform medindo validação (colunas e regras de linha),
+    limpeza e hash (no formato de chave configurado em ETL_HASH_MODE).
+    Pode rodar em outro processo: as medições voltam como dicionários
+    para o RunMetrics.extend de quem chamou.
+    Retorna (linhas boas transformadas, linhas rejeitadas, medições)."""
+    rows = len(df)
+    t0 = time.perf_counter()
+    df, rejected = split_rejected(validate(df))
+    t1 = time.perf_counter()
+    df = clean(df)
+    t2 = time.perf_counter()
+    df = add_hash(df, mode=hash_mode)
+    t3 = time.perf_counter()
+    rss = peak_rss_mb()
+    return df, rejected, [
+        {"stage": "validacao", "seconds": t1 - t0, "rows": rows, "rss_mb": rss},
+        {"stage": "limpeza", "seconds": t2 - t1, "rows": len(df), "rss_mb": rss},
+        {"stage": "hash", "seconds": t3 - t2, "rows": len(df), "rss_mb": rss},
+    ]
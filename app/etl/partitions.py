@@ -0,0 +1,111 @@
+# Particionamento mensal da fato_vendas.
+# Cada mês fica numa partição própria (fato_vendas_AAAA_MM), criada pelo
+# ETL quando aparece um mês novo. Consultas com filtro em data_venda leem
+# só as partições do período, e meses antigos podem ser desanexados
+# (e arquivados) sem reescrever a tabela.
+#
+# Uso: python -m app.etl.partitions [--detach AAAA-MM]
+
+import argparse
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.api.db import SessionLocal
+from app.etl.rollup import bump_data_version
+
+# Meses cujas partições já sabemos que existem (cache do processo)
+_known_months: set[date] = set()
+
+
+def partition_name(month: date) -> str:
+    """Nome da partição do mês (mesma regra de criar_particao_fato_vendas)."""
+    return f"fato_vendas_{month:%Y_%m}"
+
+
+def months_of(dates: pd.Series) -> list[date]:
+    """Primeiro dia de cada mês presente na coluna de datas."""
+    periods = dates.dropna().dt.to_period("M").unique()
+    return sorted(p.start_time.date() for p in periods)
+
+
+def ensure_partitions(session: Session, dates: pd.Series) -> None:
+    """Garante que existe partição para todos os meses das datas.
+    A criação roda numa conexão própria, com commit imediato, para não
+    prender a fato_vendas durante a transação do bloco. Por isso deve ser
+    chamada antes de a sessão mexer nas dimensões: o ATTACH trava
+    dim_loja e dim_produto (chaves estrangeiras) por um instante."""
+    missing = [m for m in months_of(dates) if m not in _known_months]
+    if not missing:
+        return
+    with session.get_bind().begin() as conn:
+        conn.execute(
+            text("SELECT criar_particao_fato_vendas(dia) FROM unnest(CAST(:dias AS DATE[])) AS dia"),
+            {"dias": missing},
+        )
+    _known_months.update(missing)
+
+
+def list_partitions(session: Session) -> list[dict]:
+    """Partições anexadas à fato_vendas, com o intervalo e as linhas estimadas."""
+    rows = session.execute(text("""
+        SELECT c.relname                                  AS particao,
+               pg_get_expr(c.relpartbound, c.oid)         AS intervalo,
+               GREATEST(c.reltuples, 0)::BIGINT           AS linhas_estimadas
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'fato_vendas'::regclass
+        ORDER BY c.relname;
+    """))
+    return [dict(r._mapping) for r in rows]
+
+
+def detach_partition(session: Session, month: date) -> str:
+    """Desanexa a partição de um mês e a renomeia para <partição>_arquivo.
+    Os dados saem das consultas (inclusive do agregado diário) e do ETL,
+    mas a tabela continua no banco para ser exportada (pg_dump -t) ou
+    removida. Se o mês voltar a aparecer
+    numa carga, uma partição nova e vazia é criada.
+    Retorna o nome da tabela arquivada."""
+    name = partition_name(month)
+    archived = f"{name}_arquivo"
+    session.execute(text(f"ALTER TABLE fato_vendas DETACH PARTITION {name};"))
+    session.execute(text(f"ALTER TABLE {name} RENAME TO {archived};"))
+    # O agregado diário do mês sai junto, senão a API continuaria a mostrá-lo
+    session.execute(
+        text("""
+            DELETE FROM agg_vendas_diarias
+            WHERE data_venda >= CAST(:inicio AS DATE)
+              AND data_venda < CAST(:inicio AS DATE) + INTERVAL '1 month';
+        """),
+        {"inicio": month.replace(day=1)},
+    )
+    bump_data_version(session)
+    session.commit()
+    _known_months.discard(month)
+    return archived
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Lista as partições ou desanexa a de um mês."""
+    parser = argparse.ArgumentParser(description="Partições mensais da fato_vendas")
+    parser.add_argument("--detach", metavar="AAAA-MM", default=None,
+                        help="desanexa a partição do mês e a renomeia para *_arquivo")
+    args = parser.parse_args(argv)
+
+    session = SessionLocal()
+    try:
+        if args.detach:
+            month = date.fromisoformat(f"{args.detach}-01")
+            print(f"Particao desanexada: {detach_partition(session, month)}")
+            return
+        for p in list_partitions(session):
+            print(f"{p['particao']:<22} {p['intervalo']:<55} {p['linhas_estimadas']:>12}")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
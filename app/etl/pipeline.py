@@ -0,0 +1,107 @@
+# Execução em pipeline do ETL (produtor/consumidor).
+# Uma thread lê os blocos do arquivo, um pool de processos transforma
+# e a thread que chamou o pipeline carrega no banco, tudo ao mesmo tempo.
+# A fila entre as etapas é limitada: se o banco fica lento, a leitura
+# para de avançar em vez de acumular blocos na memória.
+
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable
+
+import pandas as pd
+
+from app.etl.metrics import RunMetrics, timed_transform
+
+# Marca de fim da leitura na fila
+_DONE = object()
+
+# Intervalo (s) com que a thread de leitura confere se deve parar
+_POLL = 0.1
+
+
+def _transform_chunk(chunk: pd.DataFrame) -> tuple[int, pd.DataFrame, pd.DataFrame, list[dict]]:
+    """Transforma um bloco. Roda nos processos do pool.
+    Retorna (linhas lidas, DataFrame transformado, linhas rejeitadas,
+    medições das etapas)."""
+    rows = len(chunk)
+    df, rejected, measures = timed_transform(chunk)
+    return rows, df, rejected, measures
+
+
+def run_pipeline(
+    blocks: Iterable[tuple[pd.DataFrame, int]],
+    load: Callable[[pd.DataFrame, pd.DataFrame, int, int], tuple[int, int]],
+    workers: int,
+    depth: int,
+    metrics: RunMetrics,
+    first_chunk: int = 0,
+) -> tuple[int, int, int]:
+    """Lê, transforma e carrega os blocos com as etapas sobrepostas.
+    - uma thread consome `blocks` (extração: pares DataFrame, posição no
+      arquivo) e envia cada bloco ao pool
+    - `workers` processos transformam os blocos
+    - a thread atual chama `load(df, rejeitadas, índice do bloco, posição)`
+      para cada bloco transformado, na ordem em que foram lidos (o banco é
+      usado só por esta thread); os índices começam em first_chunk
+    No máximo `depth` blocos ficam na fila entre a leitura e a carga.
+    Um erro em qualquer etapa cancela as demais e é propagado.
+    Retorna (lidas, inseridas, ignoradas)."""
+    pending: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Espera vaga na fila, mas desiste se o pipeline foi cancelado
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(pool: ProcessPoolExecutor) -> None:
+        try:
+            for chunk, position in metrics.timed_chunks(blocks, first_chunk):
+                if not put((pool.submit(_transform_chunk, chunk), position)):
+                    return
+            put(_DONE)
+        except BaseException as exc:
+            put(exc)
+
+    def drain() -> None:
+        # Esvazia a fila cancelando os blocos que ainda não foram transformados
+        while True:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, tuple):
+                item[0].cancel()
+
+    rows_read = inserted = skipped = 0
+    pool = ProcessPoolExecutor(max_workers=workers)
+    reader = threading.Thread(target=read, args=(pool,), name="etl-extract", daemon=True)
+    reader.start()
+
+    try:
+        index = first_chunk
+        while (item := pending.get()) is not _DONE:
+            if isinstance(item, BaseException):
+                raise item
+            transformed, position = item
+            chunk_rows, df, rejected, measures = transformed.result()
+            metrics.extend(measures, index)
+            chunk_inserted, chunk_skipped = load(df, rejected, index, position)
+            index += 1
+            rows_read += chunk_rows
+            inserted += chunk_inserted
+            skipped += chunk_skipped
+    finally:
+        stop.set()
+        drain()
+        reader.join()
+        drain()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    return rows_read, inserted, skipped
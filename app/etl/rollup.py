@@ -0,0 +1,101 @@
+# Agregado diário de vendas (tabela agg_vendas_diarias).
+# Soma receita, unidades, descontos e quantidade de linhas da fato_vendas
+# por dia x loja x produto. As consultas da API e do dashboard leem daqui,
+# então o custo depende de dias x lojas x produtos e não do número de vendas.
+#
+# A carga das vendas marca em agg_vendas_pendentes os dias que receberam
+# linhas novas, na mesma transação das vendas. Ao fim de cada execução
+# refresh_rollup recalcula só esses dias. Marcas de execuções interrompidas
+# ficam no banco e são processadas pela próxima execução.
+# Cada recálculo avança a versão dos dados (etl_versao_dados), que invalida
+# o cache de respostas da API.
+#
+# Uso: python -m app.etl.rollup [--all]
+
+import argparse
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.api.db import SessionLocal
+
+
+def mark_days(session: Session, days: list[date]) -> None:
+    """Marca dias para recálculo. Não faz commit: entra na transação das vendas.
+    A tabela de pendências não tem chave única, então cargas simultâneas
+    marcando o mesmo dia não esperam uma pela outra."""
+    if not days:
+        return
+    session.execute(
+        text("INSERT INTO agg_vendas_pendentes (data_venda) SELECT unnest(CAST(:dias AS DATE[]))"),
+        {"dias": days},
+    )
+
+
+def bump_data_version(session: Session) -> None:
+    """Avança a versão dos dados lida pelo cache da API. Não faz commit:
+    entra na transação da mudança, então o cache só é invalidado quando
+    ela é confirmada."""
+    session.execute(text("UPDATE etl_versao_dados SET versao = versao + 1, atualizado_em = NOW();"))
+
+
+def refresh_rollup(session: Session, rebuild: bool = False) -> int:
+    """Recalcula o agregado dos dias pendentes (ou de todos, com rebuild)
+    e faz commit. Retorna quantas linhas do agregado foram gravadas.
+    Só processa marcas já confirmadas; marcas de cargas ainda em andamento
+    ficam para o refresh dessas cargas."""
+    # Um recálculo por vez, para dois refresh não disputarem o mesmo dia
+    session.execute(text("SELECT pg_advisory_xact_lock(hashtext('agg_vendas_diarias'));"))
+
+    if rebuild:
+        session.execute(text("DELETE FROM agg_vendas_pendentes;"))
+        session.execute(text("TRUNCATE agg_vendas_diarias;"))
+        where, params = "", {}
+    else:
+        days = session.execute(
+            text("DELETE FROM agg_vendas_pendentes RETURNING data_venda;")
+        ).scalars().all()
+        if not days:
+            session.commit()
+            return 0
+        params = {"dias": sorted(set(days))}
+        session.execute(
+            text("DELETE FROM agg_vendas_diarias WHERE data_venda = ANY(:dias);"), params
+        )
+        where = "WHERE data_venda = ANY(:dias)"
+
+    result = session.execute(
+        text(f"""
+            INSERT INTO agg_vendas_diarias
+                (data_venda, loja_id, produto_id, valor_total, quantidade, desconto, linhas)
+            SELECT data_venda, loja_id, produto_id,
+                   SUM(valor_total), SUM(quantidade), SUM(desconto), COUNT(*)
+            FROM fato_vendas
+            {where}
+            GROUP BY data_venda, loja_id, produto_id;
+        """),
+        params,
+    )
+    bump_data_version(session)
+    session.commit()
+    return result.rowcount
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Recalcula o agregado diário pela linha de comando."""
+    parser = argparse.ArgumentParser(description="Agregado diário de vendas")
+    parser.add_argument("--all", action="store_true",
+                        help="recalcula todos os dias, não só os pendentes")
+    args = parser.parse_args(argv)
+
+    session = SessionLocal()
+    try:
+        rows = refresh_rollup(session, rebuild=args.all)
+        print(f"Agregado diario atualizado: {rows} linhas gravadas")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
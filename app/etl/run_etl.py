@@ -1,104 +1,655 @@
 # Orquestrador do pipeline ETL.
 # Coordena todo o fluxo: lê o CSV, transforma os dados e carrega no banco.
 # Também registra cada execução na tabela etl_execucoes.
+# Aceita um único arquivo ou um diretório/glob com vários arquivos.
 
+import argparse
+import cProfile
+import glob
 import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Callable
 
+import pandas as pd
 from sqlalchemy import text
+from sqlalchemy.orm import Session
 
 from app.api.db import SessionLocal
-from app.etl.extract import read_csv
-from app.etl.transform import transform
-from app.etl.load import upsert_stores, upsert_products, insert_facts
+from app.config import (
+    ETL_LOAD_MODE, ETL_CHUNK_SIZE, ETL_WORKERS, ETL_DB_CONNECTIONS, ETL_PREDEDUP,
+    ETL_PIPELINE, ETL_PIPELINE_DEPTH, ETL_FACT_CONNECTIONS,
+)
+from app.etl.extract import FORMATS, COMPRESSIONS, read_file, read_file_blocks
+from app.etl.hashkey import check_hash_mode
+from app.etl.manifest import FilePlan, file_key, plan_files, full_plan, record_file
+from app.etl.metrics import RunMetrics, timed_transform
+from app.etl.partitions import ensure_partitions
+from app.etl.pipeline import run_pipeline
+from app.etl.rollup import mark_days, refresh_rollup
+from app.etl.load import (
+    upsert_stores, upsert_products, insert_facts, bulk_insert_facts,
+    drop_known_facts, clear_dimension_cache, load_sharded, quarantine_rows,
+)
 
 # Caminho padrão do CSV de dados
 DEFAULT_CSV = Path(__file__).resolve().parent.parent.parent / "data" / "sample_sales.csv"
 
+# Padrões de arquivo procurados quando a origem é um diretório
+SOURCE_PATTERNS = tuple(f"*{suffix}" for suffix in FORMATS) + tuple(
+    f"*.csv{suffix}" for suffix in COMPRESSIONS
+)
 
-def run(csv_path: str | Path | None = None) -> None:
-    """Executa o pipeline ETL completo:
-    1. Registra a execução no banco
-    2. Lê e transforma o CSV
-    3. Insere lojas, produtos e vendas
-    4. Atualiza o registro com o resultado"""
 
-    csv_path = Path(csv_path) if csv_path else DEFAULT_CSV
-    source_name = csv_path.name
+class FilesFailedError(RuntimeError):
+    """Alguns arquivos de uma carga de vários arquivos falharam.
+    Os demais foram carregados; `failed` lista os que falharam e `broken`,
+    entre eles, os que falharam porque um processo do pool morreu (o pool
+    fica inutilizável; o arquivo em si pode estar bom)."""
 
-    session = SessionLocal()
-    run_id: int | None = None
+    def __init__(self, failed: list[Path], total: int, broken: list[Path] | None = None):
+        super().__init__(f"{len(failed)} de {total} arquivos falharam")
+        self.failed = failed
+        self.broken = broken or []
 
-    try:
-        # Registra o início da execução
-        result = session.execute(
-            text("""
-                INSERT INTO etl_execucoes (nome_origem, iniciado_em, status)
-                VALUES (:nome_origem, :iniciado_em, 'executando')
-                RETURNING execucao_id;
-            """),
-            {"nome_origem": source_name, "iniciado_em": datetime.now(timezone.utc)},
+
+def start_execution(session: Session, source_name: str, parent_id: int | None = None) -> int:
+    """Registra o início de uma execução e retorna o execucao_id."""
+    result = session.execute(
+        text("""
+            INSERT INTO etl_execucoes (nome_origem, iniciado_em, status, execucao_pai_id)
+            VALUES (:nome_origem, :iniciado_em, 'executando', :execucao_pai_id)
+            RETURNING execucao_id;
+        """),
+        {
+            "nome_origem": source_name,
+            "iniciado_em": datetime.now(timezone.utc),
+            "execucao_pai_id": parent_id,
+        },
+    )
+    run_id = result.fetchone()[0]
+    session.commit()
+    return run_id
+
+
+def finish_execution(
+    session: Session, run_id: int, rows_read: int, inserted: int, skipped: int
+) -> None:
+    """Atualiza o registro da execução com o resultado (status sucesso)."""
+    session.execute(
+        text("""
+            UPDATE etl_execucoes
+            SET finalizado_em    = :finalizado_em,
+                linhas_lidas     = :linhas_lidas,
+                linhas_inseridas = :linhas_inseridas,
+                linhas_ignoradas = :linhas_ignoradas,
+                status           = 'sucesso'
+            WHERE execucao_id = :execucao_id;
+        """),
+        {
+            "finalizado_em": datetime.now(timezone.utc),
+            "linhas_lidas": rows_read,
+            "linhas_inseridas": inserted,
+            "linhas_ignoradas": skipped,
+            "execucao_id": run_id,
+        },
+    )
+    session.commit()
+
+
+def fail_execution(session: Session, run_id: int, message: str) -> None:
+    """Marca a execução como erro, guardando a mensagem."""
+    session.execute(
+        text("""
+            UPDATE etl_execucoes
+            SET finalizado_em = :finalizado_em,
+                status        = 'erro',
+                mensagem_erro = :mensagem_erro
+            WHERE execucao_id = :execucao_id;
+        """),
+        {
+            "finalizado_em": datetime.now(timezone.utc),
+            "mensagem_erro": message,
+            "execucao_id": run_id,
+        },
+    )
+    session.commit()
+
+
+def save_checkpoint(
+    session: Session,
+    run_id: int,
+    path: Path,
+    chunk: int,
+    position: int,
+    rows_read: int,
+    inserted: int,
+    skipped: int,
+) -> None:
+    """Grava o ponto de retomada da execução e faz commit, junto com o
+    bloco que acabou de ser carregado. chunk é o último bloco carregado
+    (-1 antes do primeiro) e position o byte (CSV) ou a linha
+    (Parquet/Arrow) em que ele termina."""
+    session.execute(
+        text("""
+            UPDATE etl_execucoes
+            SET checkpoint_arquivo = :checkpoint_arquivo,
+                checkpoint_bloco   = :checkpoint_bloco,
+                checkpoint_offset  = :checkpoint_offset,
+                linhas_lidas       = :linhas_lidas,
+                linhas_inseridas   = :linhas_inseridas,
+                linhas_ignoradas   = :linhas_ignoradas
+            WHERE execucao_id = :execucao_id;
+        """),
+        {
+            "checkpoint_arquivo": file_key(path),
+            "checkpoint_bloco": chunk,
+            "checkpoint_offset": position,
+            "linhas_lidas": rows_read,
+            "linhas_inseridas": inserted,
+            "linhas_ignoradas": skipped,
+            "execucao_id": run_id,
+        },
+    )
+    session.commit()
+
+
+def record_shard(session: Session, run_id: int, chunk: int, inserted: int) -> None:
+    """Registra, sem commit, as vendas inseridas por uma faixa da carga
+    paralela. Roda na transação da faixa e entra no commit dela."""
+    session.execute(
+        text("""
+            INSERT INTO etl_faixas_carregadas (execucao_id, bloco, linhas_inseridas)
+            VALUES (:execucao_id, :bloco, :linhas_inseridas);
+        """),
+        {"execucao_id": run_id, "bloco": chunk, "linhas_inseridas": inserted},
+    )
+
+
+def committed_shards(session: Session, run_id: int, chunk: int) -> int:
+    """Vendas do bloco que faixas de uma tentativa anterior já commitaram
+    (a execução caiu entre o commit das faixas e o checkpoint)."""
+    return session.execute(
+        text("""
+            SELECT COALESCE(SUM(linhas_inseridas), 0)
+            FROM etl_faixas_carregadas
+            WHERE execucao_id = :execucao_id AND bloco = :bloco;
+        """),
+        {"execucao_id": run_id, "bloco": chunk},
+    ).scalar_one()
+
+
+def resume_execution(session: Session, run_id: int) -> dict | None:
+    """Busca o checkpoint de uma execução interrompida e a marca de novo
+    como em andamento. Retorna None se a execução já terminou com sucesso."""
+    row = session.execute(
+        text("""
+            SELECT status, checkpoint_arquivo, checkpoint_bloco, checkpoint_offset,
+                   linhas_lidas, linhas_inseridas, linhas_ignoradas
+            FROM etl_execucoes
+            WHERE execucao_id = :execucao_id;
+        """),
+        {"execucao_id": run_id},
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"Execucao {run_id} nao encontrada")
+    if row.status == "sucesso":
+        return None
+    if row.checkpoint_arquivo is None:
+        raise ValueError(
+            f"Execucao {run_id} nao tem checkpoint (cargas de varios arquivos: "
+            "rode de novo a mesma origem, os arquivos ja carregados sao ignorados)"
         )
-        run_id = result.fetchone()[0]
-        session.commit()
 
-        # Lê o CSV de entrada
-        df = read_csv(csv_path)
-        rows_read = len(df)
+    session.execute(
+        text("""
+            UPDATE etl_execucoes
+            SET status = 'executando', finalizado_em = NULL, mensagem_erro = NULL
+            WHERE execucao_id = :execucao_id;
+        """),
+        {"execucao_id": run_id},
+    )
+    session.commit()
+    return dict(row._mapping)
+
+
+def insert_and_mark(session: Session, df: pd.DataFrame, store_map, product_map) -> tuple[int, int]:
+    """Carrega as vendas no modo configurado (COPY em lote ou INSERT por linha)
+    e marca para o agregado diário os dias que receberam vendas novas,
+    na mesma transação. Retorna (inseridas, ignoradas)."""
+    if ETL_LOAD_MODE == "insert":
+        inserted, skipped = insert_facts(session, df, store_map, product_map)
+    else:
+        inserted, skipped = bulk_insert_facts(session, df, store_map, product_map)
+    if inserted:
+        mark_days(session, sorted(df["sale_date"].dt.date.unique()))
+    return inserted, skipped
 
-        # Aplica as transformações (validação, limpeza, hash)
-        df = transform(df)
 
-        # Carrega os dados no banco
+def load_facts(
+    session: Session,
+    df: pd.DataFrame,
+    store_map,
+    product_map,
+    connections: int = ETL_FACT_CONNECTIONS,
+    run_id: int | None = None,
+    chunk: int | None = None,
+) -> tuple[int, int]:
+    """Carrega as vendas de um bloco.
+    Com ETL_PREDEDUP, as duplicatas são descartadas antes do envio e
+    entram na contagem de ignoradas. Com connections > 1, as vendas são
+    divididas por faixa de datas e carregadas em paralelo (ver
+    load.load_sharded); cada faixa faz commit na sua própria conexão e,
+    com run_id e chunk, registra no mesmo commit quantas linhas inseriu."""
+    known = 0
+    if ETL_PREDEDUP:
+        df, known = drop_known_facts(session, df)
+
+    if connections > 1:
+        def load_shard(shard_session: Session, shard: pd.DataFrame) -> tuple[int, int]:
+            result = insert_and_mark(shard_session, shard, store_map, product_map)
+            if run_id is not None and chunk is not None:
+                record_shard(shard_session, run_id, chunk, result[0])
+            return result
+
+        inserted, skipped = load_sharded(session, df, connections, load_shard)
+    else:
+        inserted, skipped = insert_and_mark(session, df, store_map, product_map)
+    return inserted, skipped + known
+
+
+def load_transformed(
+    session: Session,
+    df: pd.DataFrame,
+    rejected: pd.DataFrame,
+    metrics: RunMetrics,
+    run_id: int,
+    chunk: int | None = None,
+) -> tuple[int, int]:
+    """Carrega no banco um bloco já transformado, medindo cada etapa.
+    As linhas rejeitadas pelo transform vão para etl_quarentena e contam
+    como ignoradas. A quarentena fica na transação da sessão, que só faz
+    commit junto com o checkpoint do bloco: repetir o bloco numa retomada
+    não a duplica. Retorna (inseridas, ignoradas) do bloco."""
+    sharded = ETL_FACT_CONNECTIONS > 1
+
+    # Partições dos meses novos primeiro, antes de a transação tocar as dimensões
+    ensure_partitions(session, df["sale_date"])
+    with metrics.stage("dimensoes", chunk, len(df)):
         store_map = upsert_stores(session, df)
         product_map = upsert_products(session, df)
-        inserted, skipped = insert_facts(session, df, store_map, product_map)
+        if sharded:
+            # As conexões da carga paralela precisam enxergar as chaves novas
+            session.commit()
+    with metrics.stage("fatos", chunk, len(df)):
+        # Faixas já commitadas numa tentativa anterior deste bloco: as linhas
+        # delas agora voltam como ignoradas, mas foram inseridas por esta execução
+        before = committed_shards(session, run_id, chunk) if sharded and chunk is not None else 0
+        inserted, skipped = load_facts(session, df, store_map, product_map, run_id=run_id, chunk=chunk)
+        inserted, skipped = inserted + before, skipped - before
 
-        # Atualiza o registro com o resultado da execução
-        session.execute(
-            text("""
-                UPDATE etl_execucoes
-                SET finalizado_em    = :finalizado_em,
-                    linhas_lidas     = :linhas_lidas,
-                    linhas_inseridas = :linhas_inseridas,
-                    linhas_ignoradas = :linhas_ignoradas,
-                    status           = 'sucesso'
-                WHERE execucao_id = :execucao_id;
-            """),
-            {
-                "finalizado_em": datetime.now(timezone.utc),
-                "linhas_lidas": rows_read,
-                "linhas_inseridas": inserted,
-                "linhas_ignoradas": skipped,
-                "execucao_id": run_id,
-            },
-        )
-        session.commit()
+    if not rejected.empty:
+        with metrics.stage("quarentena", chunk, len(rejected)):
+            quarantine_rows(session, run_id, chunk, rejected)
+    return inserted, skipped + len(rejected)
+
+
+def load_chunk(
+    session: Session, df: pd.DataFrame, metrics: RunMetrics, run_id: int, chunk: int | None = None
+) -> tuple[int, int]:
+    """Transforma um bloco do CSV e carrega no banco.
+    Retorna (inseridas, ignoradas) do bloco."""
+    # Aplica as transformações (validação, limpeza, hash)
+    df, rejected, measures = timed_transform(df)
+    metrics.extend(measures, chunk)
+
+    # Carrega os dados no banco
+    return load_transformed(session, df, rejected, metrics, run_id, chunk)
+
+
+def plan_sources(session: Session, paths: list[Path], force: bool) -> list[FilePlan]:
+    """Decide, pelo manifesto, o que ler de cada arquivo.
+    Arquivos sem mudança são avisados e ficam de fora; os que só tiveram
+    o mtime alterado têm o manifesto atualizado. Com force, lê tudo."""
+    if force:
+        return [full_plan(p) for p in paths]
+
+    plans = []
+    for plan in plan_files(session, paths):
+        if plan.action in ("skip", "touch"):
+            if plan.action == "touch":
+                record_file(session, plan, None)
+            print(f"  {plan.path.name}: sem alteracoes desde a ultima carga, ignorado")
+        else:
+            if plan.action == "tail":
+                print(f"  {plan.path.name}: lendo apenas a partir do byte {plan.offset}")
+            plans.append(plan)
+    session.commit()
+    return plans
+
+
+def run(
+    csv_path: str | Path | None = None,
+    chunk_size: int = ETL_CHUNK_SIZE,
+    force: bool = False,
+    workers: int = ETL_WORKERS,
+    resume: int | None = None,
+) -> RunMetrics:
+    """Executa o pipeline ETL completo:
+    1. Consulta o manifesto (arquivo sem mudança é ignorado)
+    2. Registra a execução no banco
+    3. Lê o CSV em blocos de chunk_size linhas (só o trecho novo, se o
+       arquivo apenas cresceu)
+    4. Transforma cada bloco, insere lojas, produtos e vendas e faz commit
+       do bloco junto com o checkpoint da execução
+    5. Recalcula o agregado diário dos dias que receberam vendas
+    6. Atualiza o registro e o manifesto com o resultado
+    Com ETL_PIPELINE, leitura, transformação (em `workers` processos) e
+    carga dos blocos acontecem ao mesmo tempo (ver pipeline.run_pipeline).
+    Com resume=<execucao_id>, continua uma execução interrompida a partir
+    do último bloco carregado (o arquivo vem do checkpoint).
+    Retorna as medições por etapa, também gravadas em etl_etapas."""
+
+    session = SessionLocal()
+    run_id: int | None = None
+    metrics = RunMetrics()
+
+    try:
+        check_hash_mode(session)
+        if resume is not None:
+            checkpoint = resume_execution(session, resume)
+            if checkpoint is None:
+                print(f"Execucao {resume} ja foi concluida, nada a retomar")
+                return metrics
+            run_id = resume
+            csv_path = Path(checkpoint["checkpoint_arquivo"])
+            plan = full_plan(csv_path)
+            first_chunk = checkpoint["checkpoint_bloco"] + 1
+            position = checkpoint["checkpoint_offset"]
+            rows_read = checkpoint["linhas_lidas"]
+            inserted = checkpoint["linhas_inseridas"]
+            skipped = checkpoint["linhas_ignoradas"]
+            print(f"  {csv_path.name}: retomando a execucao {run_id} no bloco {first_chunk}")
+        else:
+            csv_path = Path(csv_path) if csv_path else DEFAULT_CSV
+            plans = plan_sources(session, [csv_path], force)
+            if not plans:
+                return metrics
+            plan = plans[0]
+
+            # Registra o início da execução, já com o ponto de partida
+            run_id = start_execution(session, csv_path.name)
+            first_chunk, position = 0, plan.offset
+            rows_read = inserted = skipped = 0
+            save_checkpoint(session, run_id, csv_path, -1, position, 0, 0, 0)
+
+        def commit_chunk(index: int, position: int, rows: int, result: tuple[int, int]) -> tuple[int, int]:
+            # Fecha a transação do bloco junto com o checkpoint
+            nonlocal rows_read, inserted, skipped
+            rows_read += rows
+            inserted += result[0]
+            skipped += result[1]
+            save_checkpoint(session, run_id, csv_path, index, position, rows_read, inserted, skipped)
+            return result
+
+        def load_block(df: pd.DataFrame, rejected: pd.DataFrame, index: int, position: int) -> tuple[int, int]:
+            result = load_transformed(session, df, rejected, metrics, run_id, index)
+            return commit_chunk(index, position, len(df) + len(rejected), result)
+
+        # Só até o fim planejado: é isso que o manifesto registra como lido
+        blocks = read_file_blocks(csv_path, chunk_size, position, plan.end)
+        if ETL_PIPELINE and chunk_size > 0:
+            # Etapas sobrepostas; no máximo ETL_PIPELINE_DEPTH blocos em espera
+            run_pipeline(blocks, load_block, workers, ETL_PIPELINE_DEPTH, metrics, first_chunk)
+        else:
+            # Lê, transforma e carrega um bloco por vez; só um fica na memória
+            timed = metrics.timed_chunks(blocks, first_chunk)
+            for index, (chunk, position) in enumerate(timed, start=first_chunk):
+                rows = len(chunk)
+                commit_chunk(index, position, rows, load_chunk(session, chunk, metrics, run_id, index))
+
+        with metrics.stage("agregado") as info:
+            info["rows"] = refresh_rollup(session)
+
+        # Atualiza o manifesto, as medições e o registro com o resultado da execução
+        record_file(session, plan, run_id)
+        metrics.save(session, run_id)
+        finish_execution(session, run_id, rows_read, inserted, skipped)
 
         print(f"ETL concluido! Lidas={rows_read}  Inseridas={inserted}  Ignoradas={skipped}")
+        return metrics
 
     except Exception as exc:
         session.rollback()
+        # Chaves criadas nesta transação foram desfeitas; o cache não vale mais
+        clear_dimension_cache()
 
         # Se já tínhamos um ID de execução, registra o erro no banco
+        # (com as medições das etapas que chegaram a rodar)
+        if run_id is not None:
+            metrics.save(session, run_id)
+            fail_execution(session, run_id, str(exc))
+
+        print(f"ETL falhou: {exc}", file=sys.stderr)
+        raise
+
+    finally:
+        session.close()
+
+
+def resolve_sources(source: str | Path) -> list[Path]:
+    """Expande a origem em uma lista de arquivos.
+    Aceita um arquivo, um diretório (arquivos que casam com SOURCE_PATTERNS)
+    ou um padrão glob como data/vendas_*.csv."""
+    path = Path(source)
+    if path.is_dir():
+        files = {f for pattern in SOURCE_PATTERNS for f in path.glob(pattern)}
+    elif path.exists():
+        files = {path}
+    else:
+        files = {Path(f) for f in glob.glob(str(source))}
+    return sorted(f for f in files if f.is_file())
+
+
+def is_multi_source(source: str | Path) -> bool:
+    """Diz se a origem é um diretório ou um glob (e não um arquivo só)."""
+    return Path(source).is_dir() or glob.has_magic(str(source))
+
+
+def _extract_transform(path: Path, offset: int, end: int) -> tuple[int, pd.DataFrame, pd.DataFrame, list[dict]]:
+    """Lê e transforma um arquivo (do offset até end). Roda nos processos do pool.
+    Retorna (linhas lidas, DataFrame transformado, linhas rejeitadas,
+    medições das etapas)."""
+    t0 = time.perf_counter()
+    df = read_file(path, offset, end)
+    rows = len(df)
+    read = {"stage": "leitura", "seconds": time.perf_counter() - t0, "rows": rows, "rss_mb": None}
+    df, rejected, measures = timed_transform(df)
+    read["rss_mb"] = measures[0]["rss_mb"]
+    return rows, df, rejected, [read] + measures
+
+
+def _load_file(
+    plan: FilePlan,
+    transformed: Future,
+    parent_id: int,
+    dim_lock: threading.Lock,
+    metrics: RunMetrics,
+) -> tuple[int, int, int] | None:
+    """Carrega um arquivo já transformado, com sua própria linha em etl_execucoes.
+    Roda nas threads de carga, cada uma com sua conexão.
+    As medições do arquivo são gravadas com a execução dele e somadas em `metrics`.
+    Retorna (lidas, inseridas, ignoradas) ou None se o arquivo falhou.
+    Se o pool de processos quebrou, levanta BrokenProcessPool."""
+    path = plan.path
+    session = SessionLocal()
+    run_id: int | None = None
+    file_metrics = RunMetrics()
+
+    try:
+        run_id = start_execution(session, path.name, parent_id)
+        rows_read, df, rejected, measures = transformed.result()
+        file_metrics.extend(measures, 0)
+        if not rejected.empty:
+            with file_metrics.stage("quarentena", 0, len(rejected)):
+                quarantine_rows(session, run_id, 0, rejected)
+        ensure_partitions(session, df["sale_date"])
+
+        # Dimensões são resolvidas uma thread por vez e commitadas na hora,
+        # para que o cache nunca tenha IDs que outras conexões ainda não enxergam
+        with dim_lock, file_metrics.stage("dimensoes", 0, len(df)):
+            try:
+                store_map = upsert_stores(session, df)
+                product_map = upsert_products(session, df)
+                session.commit()
+            except Exception:
+                session.rollback()
+                clear_dimension_cache()
+                raise
+
+        with file_metrics.stage("fatos", 0, len(df)):
+            # Os arquivos já carregam em paralelo, uma conexão cada; dividir
+            # as vendas de novo multiplicaria as conexões tiradas do pool
+            inserted, skipped = load_facts(session, df, store_map, product_map, connections=1)
+        skipped += len(rejected)
+        record_file(session, plan, run_id)
+        file_metrics.save(session, run_id)
+        finish_execution(session, run_id, rows_read, inserted, skipped)
+        print(f"  {path.name}: Lidas={rows_read}  Inseridas={inserted}  Ignoradas={skipped}")
+        return rows_read, inserted, skipped
+
+    except Exception as exc:
+        session.rollback()
         if run_id is not None:
+            file_metrics.save(session, run_id)
+            fail_execution(session, run_id, str(exc))
+        print(f"  {path.name}: falhou: {exc}", file=sys.stderr)
+        if isinstance(exc, BrokenProcessPool):
+            raise
+        return None
+
+    finally:
+        metrics.merge(file_metrics)
+        session.close()
+
+
+def run_many(
+    source: str | Path,
+    workers: int = ETL_WORKERS,
+    connections: int = ETL_DB_CONNECTIONS,
+    force: bool = False,
+    paths: list[Path] | None = None,
+    processes: ProcessPoolExecutor | None = None,
+) -> RunMetrics:
+    """Executa o ETL para todos os arquivos de um diretório ou glob.
+    Arquivos sem mudança segundo o manifesto são ignorados.
+    Leitura e transformação rodam em um pool de `workers` processos;
+    a carga usa no máximo `connections` conexões ao banco.
+    Cada arquivo ganha sua linha em etl_execucoes, ligada a uma
+    execução pai que soma o lote inteiro. O agregado diário é
+    recalculado uma vez, ao final, para os dias de todos os arquivos.
+    Quem já tem a lista de arquivos (ex.: o daemon) pode passá-la em
+    `paths` (source vira só o nome da execução pai) e reaproveitar um
+    pool de processos já aberto em `processes`.
+    Se algum arquivo falhar, levanta FilesFailedError depois de carregar
+    os demais (com os que pegaram o pool quebrado ou nem chegaram a ser
+    enviados a ele em `broken`). Retorna as medições por etapa somadas de
+    todos os arquivos."""
+
+    if paths is None:
+        paths = resolve_sources(source)
+    if not paths:
+        raise FileNotFoundError(f"Nenhum arquivo encontrado em {source}")
+
+    session = SessionLocal()
+    parent_id: int | None = None
+    metrics = RunMetrics()
+
+    try:
+        check_hash_mode(session)
+        plans = plan_sources(session, paths, force)
+        parent_id = start_execution(session, str(source))
+
+        dim_lock = threading.Lock()
+        # Limita quantos arquivos transformados ficam na memória esperando carga
+        slots = threading.Semaphore(workers + connections)
+
+        def load_and_release(plan: FilePlan, transformed: Future):
+            try:
+                return _load_file(plan, transformed, parent_id, dim_lock, metrics)
+            finally:
+                slots.release()
+
+        pool_context = ProcessPoolExecutor(max_workers=workers) if processes is None else nullcontext(processes)
+        with pool_context as pool, ThreadPoolExecutor(max_workers=connections) as loaders:
+            loads, unsent = [], []
+            for i, plan in enumerate(plans):
+                slots.acquire()
+                try:
+                    transformed = pool.submit(_extract_transform, plan.path, plan.offset, plan.end)
+                except BrokenProcessPool:
+                    # Um processo morreu antes de o lote inteiro ser enviado:
+                    # os arquivos já enviados terminam, os demais nem começam
+                    slots.release()
+                    unsent = [p.path for p in plans[i:]]
+                    break
+                loads.append(loaders.submit(load_and_release, plan, transformed))
+            results, broken = [], []
+            for plan, load in zip(plans, loads):
+                try:
+                    results.append(load.result())
+                except BrokenProcessPool:
+                    results.append(None)
+                    broken.append(plan.path)
+            results += [None] * len(unsent)
+            broken += unsent
+
+        # Os arquivos que deram certo já fizeram commit; atualiza o agregado
+        # mesmo que outros tenham falhado
+        with metrics.stage("agregado") as info:
+            info["rows"] = refresh_rollup(session)
+
+        done = [r for r in results if r is not None]
+        rows_read = sum(r[0] for r in done)
+        inserted = sum(r[1] for r in done)
+        skipped = sum(r[2] for r in done)
+        failed = [plan.path for plan, r in zip(plans, results) if r is None]
+
+        if failed:
             session.execute(
                 text("""
                     UPDATE etl_execucoes
-                    SET finalizado_em = :finalizado_em,
-                        status        = 'erro',
-                        mensagem_erro = :mensagem_erro
+                    SET linhas_lidas     = :linhas_lidas,
+                        linhas_inseridas = :linhas_inseridas,
+                        linhas_ignoradas = :linhas_ignoradas
                     WHERE execucao_id = :execucao_id;
                 """),
                 {
-                    "finalizado_em": datetime.now(timezone.utc),
-                    "mensagem_erro": str(exc),
-                    "execucao_id": run_id,
+                    "linhas_lidas": rows_read,
+                    "linhas_inseridas": inserted,
+                    "linhas_ignoradas": skipped,
+                    "execucao_id": parent_id,
                 },
             )
             session.commit()
+            raise FilesFailedError(failed, len(plans), broken)
+
+        finish_execution(session, parent_id, rows_read, inserted, skipped)
+        print(
+            f"ETL concluido! Arquivos={len(plans)}/{len(paths)}  Lidas={rows_read}  "
+            f"Inseridas={inserted}  Ignoradas={skipped}"
+        )
+        return metrics
 
+    except Exception as exc:
+        session.rollback()
+        if parent_id is not None:
+            fail_execution(session, parent_id, str(exc))
         print(f"ETL falhou: {exc}", file=sys.stderr)
         raise
 
@@ -106,7 +657,72 @@ def run(csv_path: str | Path | None = None) -> None:
         session.close()
 
 
-# Permite executar direto: python -m app.etl.run_etl [caminho_csv]
+def main(argv: list[str] | None = None) -> None:
+    """Interpreta a linha de comando e dispara o ETL."""
+    parser = argparse.ArgumentParser(description="Pipeline ETL de vendas")
+    parser.add_argument("source", nargs="?", default=None,
+                        help="arquivo (CSV, Parquet ou Arrow), diretório ou glob (padrão: data/sample_sales.csv)")
+    parser.add_argument("--chunk-size", type=int, default=ETL_CHUNK_SIZE,
+                        help="linhas por bloco no modo de arquivo único (0 = arquivo inteiro)")
+    parser.add_argument("--workers", type=int, default=ETL_WORKERS,
+                        help="processos de transformação (por bloco ou por arquivo)")
+    parser.add_argument("--connections", type=int, default=ETL_DB_CONNECTIONS,
+                        help="conexões de carga simultâneas para vários arquivos")
+    parser.add_argument("--force", action="store_true",
+                        help="ignora o manifesto e relê os arquivos inteiros")
+    parser.add_argument("--stats", action="store_true",
+                        help="imprime o tempo e a vazão de cada etapa ao final")
+    parser.add_argument("--profile", metavar="ARQUIVO", default=None,
+                        help="grava um profile da execução (.html usa pyinstrument, "
+                             "outras extensões usam cProfile)")
+    parser.add_argument("--resume", type=int, metavar="EXECUCAO_ID", default=None,
+                        help="continua uma execução interrompida a partir do último bloco carregado")
+    args = parser.parse_args(argv)
+    if args.resume is not None and args.source:
+        parser.error("--resume usa o arquivo gravado no checkpoint; nao informe a origem")
+
+    def execute() -> RunMetrics:
+        if args.resume is not None:
+            return run(chunk_size=args.chunk_size, workers=args.workers, resume=args.resume)
+        if args.source and is_multi_source(args.source):
+            return run_many(args.source, args.workers, args.connections, args.force)
+        return run(args.source, args.chunk_size, args.force, args.workers)
+
+    if args.profile:
+        metrics = profile(execute, args.profile)
+    else:
+        metrics = execute()
+
+    if args.stats:
+        print(metrics.report())
+
+
+def profile(func: Callable[[], RunMetrics], path: str) -> RunMetrics:
+    """Executa func sob um profiler e grava o resultado em path.
+    Só a thread principal é perfilada; os processos de transformação
+    aparecem como espera."""
+    if path.endswith(".html"):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise SystemExit("--profile com .html exige o pyinstrument (pip install pyinstrument)")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return func()
+        finally:
+            profiler.stop()
+            Path(path).write_text(profiler.output_html(), encoding="utf-8")
+            print(f"Profile gravado em {path}")
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(path)
+        print(f"Profile gravado em {path} (veja com: python -m pstats {path})")
+
+
+# Permite executar direto: python -m app.etl.run_etl [caminho_csv | diretorio | glob]
 if __name__ == "__main__":
-    csv_arg = sys.argv[1] if len(sys.argv) > 1 else None
-    run(csv_arg)
+    main()
@@ -1,8 +1,12 @@
 # Transformações dos dados de vendas.
-# Valida colunas obrigatórias, limpa os dados,
-# calcula o valor total e gera um hash único por linha.
+# Valida colunas obrigatórias, separa as linhas inválidas (quarentena),
+# limpa os dados, calcula o valor total e gera um hash único por linha.
 
 import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
 import pandas as pd
 
 # Colunas que todo CSV de vendas precisa ter
@@ -12,6 +16,9 @@ REQUIRED_COLUMNS = [
     "quantity", "unit_price", "discount",
 ]
 
+# Colunas de texto com poucos valores distintos (tratadas como categóricas)
+TEXT_COLUMNS = ["store_name", "city", "state", "sku", "product_name", "category"]
+
 
 def validate(df: pd.DataFrame) -> pd.DataFrame:
     """Verifica se todas as colunas obrigatórias existem no DataFrame."""
@@ -21,22 +28,120 @@ def validate(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def _per_value(col: pd.Series, test) -> np.ndarray:
+    """Aplica `test` (sobre um Index de textos sem espaços nas pontas) uma
+    vez por valor distinto da coluna e espalha o resultado pelas linhas.
+    Valores nulos dão False."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        codes, uniques = col.cat.codes.to_numpy(), col.cat.categories
+    else:
+        codes, uniques = pd.factorize(col)
+        uniques = pd.Index(uniques)
+    ok = np.asarray(test(uniques.astype(str).str.strip()), dtype=bool)
+    return np.append(ok, False)[codes]
+
+
+def _as_number(col: pd.Series) -> pd.Series:
+    """Coluna numérica; textos que não são número viram NaN
+    (só acontece quando o extrator leu a coluna como texto)."""
+    if pd.api.types.is_numeric_dtype(col):
+        return col
+    return pd.to_numeric(col, errors="coerce")
+
+
+def _as_date(col: pd.Series) -> pd.Series:
+    """Coluna de datas; textos que não são data viram NaT."""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    return pd.to_datetime(col, errors="coerce", format="ISO8601")
+
+
+# Tolerância da regra de desconto (meio centavo, por causa do float)
+_DISCOUNT_TOLERANCE = 0.005
+
+# Regras de linha, na ordem em que o motivo da rejeição é escolhido
+REJECTION_REASONS = [
+    "chave nula",
+    "data invalida",
+    "quantidade invalida",
+    "preco invalido",
+    "desconto invalido",
+    "estado invalido",
+]
+
+
+def split_rejected(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Separa as linhas que violam alguma regra:
+    - loja e SKU preenchidos, data válida
+    - quantidade inteira e positiva, preço numérico e não negativo
+    - desconto numérico (ou vazio) e no máximo igual ao valor bruto
+    - estado com duas letras
+    As regras são vetorizadas; as de texto rodam uma vez por valor distinto.
+    Retorna (linhas boas, linhas rejeitadas com os valores originais e a
+    coluna motivo). Sem rejeições, as linhas boas são o próprio DataFrame."""
+    raw = {c: df[c] for c in ("sale_date", "quantity", "unit_price", "discount")}
+    parsed = {c: _as_date(v) if c == "sale_date" else _as_number(v) for c, v in raw.items()}
+    sale_date, quantity, unit_price, discount = parsed.values()
+    gross = quantity * unit_price
+
+    def nonblank(values: pd.Index) -> np.ndarray:
+        return values.str.len() > 0
+
+    conditions = [
+        ~(_per_value(df["store_name"], nonblank) & _per_value(df["sku"], nonblank)),
+        sale_date.isna().to_numpy(),
+        ~((quantity > 0) & (quantity % 1 == 0)).to_numpy(),
+        ~(unit_price >= 0).to_numpy(),
+        ((discount.isna() & raw["discount"].notna()) | (discount > gross + _DISCOUNT_TOLERANCE)).to_numpy(),
+        ~_per_value(df["state"], lambda v: v.str.upper().str.fullmatch("[A-Z]{2}")),
+    ]
+    bad = np.logical_or.reduce(conditions)
+
+    # Colunas que eram texto e foram convertidas
+    changed = {c: v for c, v in parsed.items() if v is not raw[c]}
+
+    if not bad.any():
+        for c, v in changed.items():
+            df[c] = v
+        return df, df.iloc[:0].assign(motivo=pd.Series(dtype=object))
+
+    rejected = df[bad].copy()
+    rejected["motivo"] = np.select(conditions, REJECTION_REASONS, default="")[bad]
+    good = df[~bad].copy()
+    for c, v in changed.items():
+        good[c] = v[~bad]
+    return good, rejected
+
+
+def _strip_categories(col: pd.Series, upper: bool = False) -> pd.Series:
+    """Remove espaços (e opcionalmente converte para maiúsculas) uma vez
+    por valor distinto em vez de uma vez por linha.
+    A coluna vira categórica; categorias que ficam iguais depois da
+    limpeza (ex.: "SP" e "SP ") são unificadas."""
+    if not isinstance(col.dtype, pd.CategoricalDtype):
+        col = col.astype("category")
+    categories = col.cat.categories.str.strip()
+    if upper:
+        categories = categories.str.upper()
+    new_codes, unique = pd.factorize(categories)
+    codes = col.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, new_codes[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=unique), index=col.index)
+
+
 def clean(df: pd.DataFrame) -> pd.DataFrame:
     """Limpa e padroniza os dados:
     - Remove espaços extras dos textos
     - Converte estado para maiúsculas
     - Preenche descontos vazios com zero
-    - Calcula o valor total (quantidade * preço - desconto)"""
-    df = df.copy()
+    - Calcula o valor total (quantidade * preço - desconto)
+    As colunas de texto ficam categóricas para economizar memória.
+    Altera o DataFrame recebido (sem cópia)."""
     df.columns = df.columns.str.strip().str.lower()
 
-    # Remove espaços das colunas de texto
-    df["store_name"] = df["store_name"].str.strip()
-    df["sku"] = df["sku"].str.strip()
-    df["product_name"] = df["product_name"].str.strip()
-    df["category"] = df["category"].str.strip()
-    df["city"] = df["city"].str.strip()
-    df["state"] = df["state"].str.strip().str.upper()
+    # Remove espaços das colunas de texto (uma vez por categoria)
+    for col in TEXT_COLUMNS:
+        df[col] = _strip_categories(df[col], upper=(col == "state"))
 
     # Garante tipos numéricos corretos
     df["quantity"] = df["quantity"].astype(int)
@@ -56,16 +161,75 @@ def _row_hash(row: pd.Series) -> str:
     return hashlib.sha256(payload.encode()).hexdigest()
 
 
-def add_hash(df: pd.DataFrame) -> pd.DataFrame:
-    """Adiciona a coluna source_row_hash ao DataFrame."""
-    df = df.copy()
-    df["source_row_hash"] = df.apply(_row_hash, axis=1)
+# Tamanho dos lotes de hash distribuídos entre processos
+HASH_BATCH_SIZE = 250_000
+
+# Formatos da chave de deduplicação (ver app/etl/hashkey.py):
+# "hex" (SHA-256 em 64 caracteres), "bytea" (16 primeiros bytes do SHA-256)
+# ou "int64" (8 primeiros bytes, como inteiro com sinal)
+HASH_MODES = ("hex", "bytea", "int64")
+
+
+def _as_text(col: pd.Series) -> np.ndarray:
+    """Converte uma coluna para texto exatamente como str(valor) faria.
+    O str() roda só uma vez por valor distinto (factorize) e o resultado
+    é espalhado pelas linhas; valores nulos são convertidos um a um."""
+    codes, uniques = pd.factorize(col)
+    text_values = np.asarray([str(u) for u in uniques] + [""], dtype=object)[codes]
+    nulls = codes == -1
+    if nulls.any():
+        text_values[nulls] = [str(v) for v in col.to_numpy(dtype=object)[nulls]]
+    return text_values
+
+
+def _hash_batch(payloads: list[str], mode: str = "hex") -> list:
+    """Calcula o SHA-256 de uma lista de textos, no formato `mode`."""
+    sha256 = hashlib.sha256
+    if mode == "bytea":
+        return [sha256(p.encode()).digest()[:16] for p in payloads]
+    if mode == "int64":
+        from_bytes = int.from_bytes
+        return [from_bytes(sha256(p.encode()).digest()[:8], "big", signed=True) for p in payloads]
+    return [sha256(p.encode()).hexdigest() for p in payloads]
+
+
+def row_hashes(df: pd.DataFrame, workers: int = 1, mode: str = "hex") -> pd.Series:
+    """Gera o hash de todas as linhas de uma vez.
+    Converte cada coluna para texto de forma vetorizada, monta o texto
+    "col1|col2|..." e calcula os hashes em lotes de HASH_BATCH_SIZE linhas,
+    opcionalmente em vários processos. Só os textos de um lote ficam na
+    memória por vez. No modo "hex" o resultado é idêntico ao de _row_hash
+    aplicado linha a linha; os modos compactos são prefixos do mesmo SHA-256."""
+    if mode not in HASH_MODES:
+        raise ValueError(f"Formato de hash desconhecido: {mode} (use {', '.join(HASH_MODES)})")
+    columns = [_as_text(df[c]) for c in REQUIRED_COLUMNS]
+
+    def payloads(start: int) -> list[str]:
+        batch = (c[start:start + HASH_BATCH_SIZE] for c in columns)
+        return ["|".join(values) for values in zip(*batch)]
+
+    hash_batch = partial(_hash_batch, mode=mode)
+    starts = range(0, len(df), HASH_BATCH_SIZE)
+    if workers > 1 and len(df) > HASH_BATCH_SIZE:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashes = [h for batch in pool.map(hash_batch, map(payloads, starts)) for h in batch]
+    else:
+        hashes = [h for start in starts for h in hash_batch(payloads(start))]
+
+    return pd.Series(hashes, index=df.index, dtype="int64" if mode == "int64" else object)
+
+
+def add_hash(df: pd.DataFrame, workers: int = 1, mode: str = "hex") -> pd.DataFrame:
+    """Adiciona a coluna source_row_hash ao DataFrame (sem cópia)."""
+    df["source_row_hash"] = row_hashes(df, workers, mode)
     return df
 
 
-def transform(df: pd.DataFrame) -> pd.DataFrame:
-    """Pipeline completo de transformação: validar -> limpar -> gerar hash."""
+def transform(df: pd.DataFrame, hash_mode: str = "hex") -> pd.DataFrame:
+    """Pipeline completo de transformação: validar -> limpar -> gerar hash.
+    As linhas rejeitadas pelas regras são descartadas."""
     df = validate(df)
+    df, _ = split_rejected(df)
     df = clean(df)
-    df = add_hash(df)
+    df = add_hash(df, mode=hash_mode)
     return df
@@ -0,0 +1,100 @@
+# Benchmark do acesso ao banco pela API: caminho síncrono antigo x assíncrono.
+# Simula N clientes simultâneos, cada um repetindo uma consulta da API assim
+# que recebe a resposta anterior. O caminho síncrono reproduz os endpoints
+# "def" do FastAPI: threadpool de 40 threads (padrão do AnyIO) e o engine
+# síncrono com pool_size=5. O assíncrono usa o engine e o pool de db.py.
+# O cache de respostas fica de fora: cada requisição vai ao banco.
+#
+# Uso: python -m benchmarks.bench_api_async [--clients 50 100 200 500] [--requests 20]
+
+import argparse
+import asyncio
+import time
+from datetime import date
+
+import anyio
+import numpy as np
+from anyio import to_thread
+
+from app.api import queries
+from app.api.db import AsyncSessionLocal, async_engine, engine, SessionLocal
+
+# Threads que o FastAPI usa para os endpoints síncronos
+THREADPOOL_SIZE = 40
+
+
+def sync_request(query, params: dict) -> int:
+    """Uma requisição no caminho antigo: sessão síncrona, consulta e fecha."""
+    session = SessionLocal()
+    try:
+        return len(session.execute(query, params).all())
+    finally:
+        session.close()
+
+
+async def async_request(query, params: dict) -> int:
+    """Uma requisição no caminho novo, com sessão assíncrona."""
+    async with AsyncSessionLocal() as session:
+        return len((await session.execute(query, params)).all())
+
+
+async def run_clients(clients: int, requests: int, request) -> tuple[float, list[float]]:
+    """Roda `clients` clientes com `requests` requisições cada.
+    Retorna (segundos no total, latência de cada requisição em s)."""
+    latencies: list[float] = []
+
+    async def client() -> None:
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - t0, latencies
+
+
+async def bench(clients_list: list[int], requests: int, query, params: dict) -> None:
+    limiter = anyio.CapacityLimiter(THREADPOOL_SIZE)
+    paths = {
+        "sync":  lambda: to_thread.run_sync(sync_request, query, params, limiter=limiter),
+        "async": lambda: async_request(query, params),
+    }
+    # Aquece os dois pools antes de medir
+    for request in paths.values():
+        await run_clients(THREADPOOL_SIZE, 1, request)
+
+    for clients in clients_list:
+        for name, request in paths.items():
+            elapsed, latencies = await run_clients(clients, requests, request)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{clients:>4} clientes {name:>5}: {len(latencies) / elapsed:>8,.0f} req/s  "
+                  f"p50 {p50:7.1f} ms  p99 {p99:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da API: banco síncrono x assíncrono")
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 100, 200, 500])
+    parser.add_argument("--requests", type=int, default=20, help="requisições por cliente")
+    parser.add_argument("--query", default="DAILY_REVENUE", help="consulta de app/api/queries.py")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2024, 1, 1))
+    parser.add_argument("--end", type=date.fromisoformat, default=date(2024, 12, 31))
+    args = parser.parse_args()
+
+    query = getattr(queries, args.query)
+    params = {"start": args.start, "end": args.end}
+    if args.query == "TOP_PRODUCTS":
+        params["limit"] = 10
+
+    async def run() -> None:
+        try:
+            await bench(args.clients, args.requests, query, params)
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
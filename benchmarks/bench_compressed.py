@@ -0,0 +1,65 @@
+# Benchmark de leitura de CSV comprimido.
+# Compara a vazão ponta a ponta (leitura em blocos + transform) de um CSV
+# sem compressão com as versões gzip, zstd e bz2 do mesmo arquivo,
+# descomprimidas em fluxo durante a leitura.
+#
+# Uso: python -m benchmarks.bench_compressed [linhas] [--chunk-size N]
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from app.etl.extract import read_file_chunks
+from app.etl.transform import transform
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / "data" / "sample_sales.csv"
+
+CODECS = {"gzip": ".gz", "zstd": ".zst", "bz2": ".bz2"}
+
+
+def write_inputs(rows: int, folder: Path) -> list[Path]:
+    """Gera o CSV de teste e suas versões comprimidas."""
+    plain = folder / "vendas.csv"
+    base = pd.read_csv(SAMPLE_CSV)
+    base.sample(rows, replace=True, random_state=42).to_csv(plain, index=False)
+
+    paths = [plain]
+    data = plain.read_bytes()
+    for codec, suffix in CODECS.items():
+        path = folder / f"vendas.csv{suffix}"
+        with pa.CompressedOutputStream(str(path), codec) as out:
+            out.write(data)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de CSV comprimido")
+    parser.add_argument("rows", nargs="?", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_inputs(args.rows, Path(tmp))
+        plain_mb = paths[0].stat().st_size / 1e6
+        print(f"{args.rows:,} linhas, {plain_mb:.1f} MB sem compressão")
+
+        for path in paths:
+            t0 = time.perf_counter()
+            rows = 0
+            for chunk in read_file_chunks(path, args.chunk_size):
+                rows += len(transform(chunk))
+            elapsed = time.perf_counter() - t0
+            print(
+                f"  {path.name:18s} {path.stat().st_size / 1e6:8.1f} MB  "
+                f"{elapsed:6.2f}s  {rows / elapsed:10,.0f} linhas/s  "
+                f"{plain_mb / elapsed:6.1f} MB/s (descomprimido)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Benchmark do hash de linhas (transform.add_hash).
+# Compara o caminho antigo (df.apply linha a linha) com o vetorizado,
+# com 1 processo e com vários processos.
+#
+# Uso: python -m benchmarks.bench_hash [linhas ...] [--workers N] [--sem-antigo]
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from app.etl.transform import clean, row_hashes, _row_hash
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / "data" / "sample_sales.csv"
+
+
+def sample_frame(rows: int) -> pd.DataFrame:
+    """Monta um DataFrame limpo com `rows` linhas a partir do CSV de exemplo."""
+    base = clean(pd.read_csv(SAMPLE_CSV, parse_dates=["sale_date"]))
+    return base.sample(rows, replace=True, random_state=42).reset_index(drop=True)
+
+
+def timed(fn) -> tuple[float, pd.Series]:
+    """Executa fn() e retorna (segundos, resultado)."""
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do hash de linhas")
+    parser.add_argument("rows", nargs="*", type=int, default=[1_000_000, 10_000_000])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--sem-antigo", action="store_true",
+                        help="não roda o caminho antigo (lento em 10M linhas)")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        df = sample_frame(rows)
+        print(f"\n{rows:,} linhas")
+
+        t_vec, vec = timed(lambda: row_hashes(df))
+        print(f"  vetorizado (1 processo):   {t_vec:8.2f}s")
+
+        if args.workers > 1:
+            t_par, par = timed(lambda: row_hashes(df, workers=args.workers))
+            assert par.equals(vec)
+            print(f"  vetorizado ({args.workers} processos):  {t_par:8.2f}s")
+
+        if not args.sem_antigo:
+            t_old, old = timed(lambda: df.apply(_row_hash, axis=1))
+            assert old.equals(vec), "hashes diferentes do caminho antigo"
+            print(f"  antigo (df.apply):         {t_old:8.2f}s  "
+                  f"(ganho {t_old / t_vec:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
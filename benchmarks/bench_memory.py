@@ -0,0 +1,55 @@
+# Benchmark de memória da etapa de transformação.
+# Lê um arquivo inteiro e mede o pico de memória do transform
+# (tracemalloc, que enxerga as alocações do numpy/pandas) e o pico
+# de RSS do processo.
+#
+# Uso: python -m benchmarks.bench_memory [arquivo] [--rows N]
+
+import argparse
+import resource
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+from app.etl.extract import read_file
+from app.etl.transform import transform
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / "data" / "sample_sales.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memória do transform")
+    parser.add_argument("path", nargs="?", default=None,
+                        help="arquivo de entrada (padrão: gera um a partir do CSV de exemplo)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = Path(tmp) / "vendas.csv"
+            base = pd.read_csv(SAMPLE_CSV)
+            base.sample(args.rows, replace=True, random_state=42).to_csv(path, index=False)
+
+        df = read_file(path)
+        frame_mb = df.memory_usage(deep=True).sum() / 1e6
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        df = transform(df)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"{len(df):,} linhas")
+    print(f"  DataFrame lido:        {frame_mb:8.1f} MB")
+    print(f"  DataFrame final:       {df.memory_usage(deep=True).sum() / 1e6:8.1f} MB")
+    print(f"  pico do transform:     {peak / 1e6:8.1f} MB  ({elapsed:.2f}s)")
+    print(f"  pico de RSS:           {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Benchmark da carga paralela das vendas (load.load_sharded).
+# Carrega o mesmo volume de vendas com 1, 2, 4 e 8 conexões e mede a vazão.
+# Cada rodada usa um ano distante (2090, 2091, ...) para não se misturar com
+# dados reais nem com as outras rodadas; ao final as partições criadas são
+# removidas. Rode contra um Postgres local (DATABASE_URL), nunca em produção.
+#
+# Uso: python -m benchmarks.bench_parallel_load [--rows N] [--connections 1 2 4 8] [--keep]
+
+import argparse
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from app.api.db import SessionLocal
+from app.config import ETL_HASH_MODE
+from app.etl.load import upsert_stores, upsert_products
+from app.etl.partitions import ensure_partitions, months_of, partition_name
+from app.etl.run_etl import load_facts
+from app.etl.transform import transform
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / "data" / "sample_sales.csv"
+
+# Primeiro ano usado pelas rodadas
+BASE_YEAR = 2090
+
+
+def sample_frame(rows: int, year: int) -> pd.DataFrame:
+    """Vendas transformadas com `rows` linhas espalhadas pelos dias de `year`.
+    Quantidades aleatórias deixam quase todas as linhas com hash distinto."""
+    rng = np.random.default_rng(year)
+    df = pd.read_csv(SAMPLE_CSV).sample(rows, replace=True, random_state=year)
+    days = pd.date_range(date(year, 1, 1), date(year, 12, 31), freq="D")
+    df["sale_date"] = days[rng.integers(0, len(days), rows)].strftime("%Y-%m-%d")
+    df["quantity"] = rng.integers(1, 1000, rows)
+    return transform(df.reset_index(drop=True), hash_mode=ETL_HASH_MODE)
+
+
+def cleanup(session, years: list[int]) -> None:
+    """Remove as partições, o agregado e as marcas dos anos do benchmark."""
+    for year in years:
+        start, end = date(year, 1, 1), date(year, 12, 31)
+        for month in months_of(pd.Series(pd.date_range(start, end, freq="MS"))):
+            session.execute(text(f"DROP TABLE IF EXISTS {partition_name(month)};"))
+        params = {"start": start, "end": end}
+        session.execute(
+            text("DELETE FROM agg_vendas_pendentes WHERE data_venda BETWEEN :start AND :end;"), params
+        )
+        session.execute(
+            text("DELETE FROM agg_vendas_diarias WHERE data_venda BETWEEN :start AND :end;"), params
+        )
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da carga paralela de vendas")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--keep", action="store_true",
+                        help="mantém as vendas carregadas (não remove as partições)")
+    args = parser.parse_args()
+
+    years = [BASE_YEAR + i for i in range(len(args.connections))]
+    session = SessionLocal()
+    try:
+        cleanup(session, years)
+        base = None
+        for connections, year in zip(args.connections, years):
+            df = sample_frame(args.rows, year)
+            expected = df["source_row_hash"].nunique()
+
+            ensure_partitions(session, df["sale_date"])
+            store_map = upsert_stores(session, df)
+            product_map = upsert_products(session, df)
+            session.commit()
+
+            t0 = time.perf_counter()
+            inserted, skipped = load_facts(session, df, store_map, product_map, connections)
+            session.commit()
+            elapsed = time.perf_counter() - t0
+
+            # Contadores: cada hash entra uma vez e uma segunda carga ignora tudo
+            assert (inserted, skipped) == (expected, len(df) - expected), (inserted, skipped)
+            again = load_facts(session, df, store_map, product_map, connections)
+            session.commit()
+            assert again == (0, len(df)), again
+
+            rate = len(df) / elapsed
+            base = base or rate
+            print(f"{connections:>2} conexoes: {elapsed:8.2f}s  {rate:>12,.0f} linhas/s  "
+                  f"(ganho {rate / base:.1f}x)")
+    finally:
+        if not args.keep:
+            cleanup(session, years)
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
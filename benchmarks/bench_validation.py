@@ -0,0 +1,54 @@
+# Benchmark das regras de validação por linha (transform.split_rejected).
+# Mede o custo das regras em relação ao transform completo, com um arquivo
+# limpo e com uma fração de linhas inválidas.
+#
+# Uso: python -m benchmarks.bench_validation [linhas ...] [--bad 0.01]
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.etl.transform import split_rejected, clean, add_hash
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / "data" / "sample_sales.csv"
+
+
+def sample_frame(rows: int, bad: float) -> pd.DataFrame:
+    """DataFrame bruto com `rows` linhas, uma fração `bad` delas inválida."""
+    base = pd.read_csv(SAMPLE_CSV, parse_dates=["sale_date"])
+    df = base.sample(rows, replace=True, random_state=42).reset_index(drop=True)
+    rng = np.random.default_rng(42)
+    broken = rng.random(rows) < bad
+    df.loc[broken, "quantity"] = -1
+    return df
+
+
+def timed(fn) -> tuple[float, object]:
+    """Executa fn() e retorna (segundos, resultado)."""
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das regras de validação")
+    parser.add_argument("rows", nargs="*", type=int, default=[1_000_000])
+    parser.add_argument("--bad", type=float, default=0.01,
+                        help="fração de linhas inválidas no segundo caso")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        for bad in (0.0, args.bad):
+            df = sample_frame(rows, bad)
+            t_rules, (df, rejected) = timed(lambda: split_rejected(df))
+            t_rest, _ = timed(lambda: add_hash(clean(df)))
+            total = t_rules + t_rest
+            print(f"{rows:,} linhas, {bad:.1%} invalidas: regras {t_rules:6.3f}s de {total:6.3f}s "
+                  f"({t_rules / total:.1%})  rejeitadas={len(rejected):,}")
+
+
+if __name__ == "__main__":
+    main()
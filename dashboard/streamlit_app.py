@@ -199,6 +199,7 @@ st.markdown("""
 
 
 # Consultas ao banco
+# Leem o agregado diário agg_vendas_diarias (mantido pelo ETL), não a fato_vendas
 
 def _run(sql, params):
     """Executa uma query e retorna um DataFrame."""
@@ -223,8 +224,8 @@ def query_daily(start, end, categories=None, stores=None):
         wheres += f" AND l.nome_loja IN {_in_clause('st', stores, params)}"
     return _run(
         f"SELECT data_venda AS date, SUM(valor_total)::FLOAT AS revenue, "
-        f"SUM(quantidade) AS units, SUM(desconto)::FLOAT AS discount "
-        f"FROM fato_vendas{joins} WHERE data_venda BETWEEN :s AND :e{wheres} GROUP BY 1 ORDER BY 1",
+        f"SUM(quantidade)::BIGINT AS units, SUM(desconto)::FLOAT AS discount "
+        f"FROM agg_vendas_diarias{joins} WHERE data_venda BETWEEN :s AND :e{wheres} GROUP BY 1 ORDER BY 1",
         params,
     )
 
@@ -239,51 +240,67 @@ def query_monthly(start, end, categories=None, stores=None):
         wheres += f" AND l.nome_loja IN {_in_clause('st', stores, params)}"
     return _run(
         f"SELECT TO_CHAR(data_venda, 'YYYY-MM') AS month, SUM(valor_total)::FLOAT AS revenue, "
-        f"SUM(quantidade) AS units, SUM(desconto)::FLOAT AS discount, COUNT(*) AS rows "
-        f"FROM fato_vendas{joins} WHERE data_venda BETWEEN :s AND :e{wheres} GROUP BY 1 ORDER BY 1",
+        f"SUM(quantidade)::BIGINT AS units, SUM(desconto)::FLOAT AS discount, SUM(linhas)::BIGINT AS rows "
+        f"FROM agg_vendas_diarias{joins} WHERE data_venda BETWEEN :s AND :e{wheres} GROUP BY 1 ORDER BY 1",
         params,
     )
 
-@st.cache_data(ttl=120, show_spinner=False)
-def query_top_products(start, end, limit=500):
-    return _run(
-        "SELECT p.sku, p.nome_produto AS product_name, p.categoria AS category, "
-        "SUM(f.quantidade) AS units, SUM(f.valor_total)::FLOAT AS revenue "
-        "FROM fato_vendas f JOIN dim_produto p USING (produto_id) "
-        "WHERE f.data_venda BETWEEN :s AND :e "
-        "GROUP BY p.sku, p.nome_produto, p.categoria ORDER BY revenue DESC LIMIT :lim",
-        {"s": start, "e": end, "lim": limit},
-    )
-
-@st.cache_data(ttl=120, show_spinner=False)
-def query_stores(start, end):
-    return _run(
-        "SELECT l.nome_loja AS store_name, SUM(f.valor_total)::FLOAT AS revenue, "
-        "SUM(f.quantidade) AS units, COUNT(*) AS transaction_count "
-        "FROM fato_vendas f JOIN dim_loja l USING (loja_id) "
-        "WHERE f.data_venda BETWEEN :s AND :e GROUP BY l.nome_loja ORDER BY revenue DESC",
-        {"s": start, "e": end},
-    )
-
-@st.cache_data(ttl=120, show_spinner=False)
-def query_categories(start, end):
-    return _run(
-        "SELECT p.categoria AS category, SUM(f.valor_total)::FLOAT AS revenue, "
-        "SUM(f.quantidade) AS units "
-        "FROM fato_vendas f JOIN dim_produto p USING (produto_id) "
-        "WHERE f.data_venda BETWEEN :s AND :e GROUP BY 1 ORDER BY revenue DESC",
-        {"s": start, "e": end},
+# Agregados sem filtro numa consulta só (GROUPING SETS), como o /bundle da API:
+# uma passada pelo agregado diário por atualização do dashboard. O top de
+# produtos é cortado e cada agregado é ordenado no próprio banco.
+_BUNDLE_SQL = """
+    WITH base AS (
+        SELECT TO_CHAR(f.data_venda, 'YYYY-MM') AS month, f.data_venda AS date,
+               p.sku, p.nome_produto AS product_name, p.categoria AS category,
+               l.nome_loja AS store_name, f.valor_total, f.quantidade, f.desconto, f.linhas
+        FROM agg_vendas_diarias f
+        JOIN dim_loja l USING (loja_id)
+        JOIN dim_produto p USING (produto_id)
+        WHERE f.data_venda BETWEEN :s AND :e
+    ),
+    sets AS (
+        SELECT CASE GROUPING(month, date, sku, store_name, category)
+                   WHEN 15 THEN 'monthly' WHEN 23 THEN 'daily' WHEN 26 THEN 'top_products'
+                   WHEN 29 THEN 'stores' WHEN 13 THEN 'stores_monthly' WHEN 30 THEN 'categories'
+               END AS bundle_set,
+               month, date, sku, product_name, category, store_name,
+               SUM(valor_total)::FLOAT AS revenue, SUM(quantidade)::BIGINT AS units,
+               SUM(desconto)::FLOAT AS discount, SUM(linhas)::BIGINT AS rows
+        FROM base
+        GROUP BY GROUPING SETS ((month), (date), (sku, product_name, category),
+                                (store_name), (month, store_name), (category))
+    ),
+    ranked AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY bundle_set ORDER BY revenue DESC) AS posicao
+        FROM sets
     )
+    SELECT * FROM ranked
+    WHERE bundle_set <> 'top_products' OR posicao <= :lim
+    ORDER BY bundle_set,
+             CASE WHEN bundle_set IN ('top_products', 'stores', 'categories') THEN revenue END DESC,
+             month, date, store_name, category
+"""
+
+# Colunas de cada agregado do pacote (as mesmas dos endpoints da API)
+_BUNDLE_SETS = {
+    "daily":          ["date", "revenue", "units", "discount"],
+    "monthly":        ["month", "revenue", "units", "discount", "rows"],
+    "top_products":   ["sku", "product_name", "category", "units", "revenue"],
+    "stores":         ["store_name", "revenue", "units", "rows"],
+    "categories":     ["category", "revenue", "units"],
+    "stores_monthly": ["month", "store_name", "revenue"],
+}
 
 @st.cache_data(ttl=120, show_spinner=False)
-def query_stores_monthly(start, end):
-    return _run(
-        "SELECT TO_CHAR(f.data_venda, 'YYYY-MM') AS month, l.nome_loja AS store_name, "
-        "SUM(f.valor_total)::FLOAT AS revenue "
-        "FROM fato_vendas f JOIN dim_loja l USING (loja_id) "
-        "WHERE f.data_venda BETWEEN :s AND :e GROUP BY 1, 2 ORDER BY 1, 2",
-        {"s": start, "e": end},
-    )
+def query_bundle(start, end, limit=500):
+    """Todos os agregados sem filtro, num dict de DataFrames."""
+    df = _run(_BUNDLE_SQL, {"s": start, "e": end, "lim": limit})
+    bundle = {}
+    for name, cols in _BUNDLE_SETS.items():
+        part = df[df["bundle_set"] == name][cols] if not df.empty else pd.DataFrame(columns=cols)
+        bundle[name] = part.reset_index(drop=True)
+    bundle["stores"] = bundle["stores"].rename(columns={"rows": "transaction_count"})
+    return bundle
 
 
 # Formatadores de valor
@@ -373,8 +390,9 @@ with st.sidebar:
     st.markdown("---")
 
     with st.spinner(""):
-        ref_cats = query_categories(str(s_date), str(e_date))
-        ref_stores = query_stores(str(s_date), str(e_date))
+        ref_bundle = query_bundle(str(s_date), str(e_date))
+        ref_cats = ref_bundle["categories"]
+        ref_stores = ref_bundle["stores"]
 
     sel_cats = st.multiselect(
         "CATEGORIAS",
@@ -397,12 +415,18 @@ sd, ed = str(s_date), str(e_date)
 cats_filter = tuple(sel_cats) if sel_cats else None
 stores_filter = tuple(sel_stores) if sel_stores else None
 
-df_d  = query_daily(sd, ed, categories=cats_filter, stores=stores_filter)
-df_m  = query_monthly(sd, ed, categories=cats_filter, stores=stores_filter)
-df_p  = query_top_products(sd, ed)
-df_s  = query_stores(sd, ed)
-df_c  = query_categories(sd, ed)
-df_sm = query_stores_monthly(sd, ed)
+# Sem filtros, tudo sai do pacote (já carregado na barra lateral);
+# com filtros, só as séries diária e mensal são consultadas de novo
+bundle = query_bundle(sd, ed)
+if cats_filter or stores_filter:
+    df_d = query_daily(sd, ed, categories=cats_filter, stores=stores_filter)
+    df_m = query_monthly(sd, ed, categories=cats_filter, stores=stores_filter)
+else:
+    df_d, df_m = bundle["daily"], bundle["monthly"]
+df_p  = bundle["top_products"]
+df_s  = bundle["stores"]
+df_c  = bundle["categories"]
+df_sm = bundle["stores_monthly"]
 
 if df_d.empty:
     st.markdown("""
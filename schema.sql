@@ -19,11 +19,30 @@ CREATE TABLE IF NOT EXISTS dim_produto (
     categoria    TEXT
 );
 
+-- Bancos criados antes do particionamento: a fato_vendas comum sai do caminho
+-- (com seus indices e sequencia) e os dados sao copiados mais abaixo
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('fato_vendas') AND relkind = 'r') THEN
+        ALTER TABLE fato_vendas RENAME TO fato_vendas_legado;
+        ALTER INDEX fato_vendas_pkey RENAME TO fato_vendas_legado_pkey;
+        ALTER INDEX fato_vendas_hash_origem_key RENAME TO fato_vendas_legado_hash_origem_key;
+        ALTER INDEX IF EXISTS idx_fato_vendas_data RENAME TO idx_fato_vendas_legado_data;
+        ALTER SEQUENCE fato_vendas_venda_id_seq RENAME TO fato_vendas_legado_venda_id_seq;
+    END IF;
+END $$;
+
 -- Tabela Fato: Vendas
 -- Cada linha representa uma transacao de venda
 -- Referencia as dimensoes loja e produto por chave estrangeira
+-- Particionada por mes de data_venda (fato_vendas_AAAA_MM): consultas por
+-- periodo so leem os meses pedidos e meses antigos podem ser desanexados.
+-- As chaves unicas incluem data_venda, exigencia do particionamento
+-- (o hash ja inclui a data, entao a unicidade do hash nao muda)
+-- hash_origem nasce como TEXT (SHA-256 em hex); pode ser convertido para
+-- BYTEA (16 bytes) ou BIGINT (8 bytes) com python -m app.etl.hashkey --migrate
 CREATE TABLE IF NOT EXISTS fato_vendas (
-    venda_id       BIGSERIAL PRIMARY KEY,
+    venda_id       BIGSERIAL,
     data_venda     DATE NOT NULL,
     loja_id        BIGINT NOT NULL REFERENCES dim_loja (loja_id),
     produto_id     BIGINT NOT NULL REFERENCES dim_produto (produto_id),
@@ -31,10 +50,89 @@ CREATE TABLE IF NOT EXISTS fato_vendas (
     preco_unitario NUMERIC(12, 2) NOT NULL,
     desconto       NUMERIC(12, 2) NOT NULL DEFAULT 0,
     valor_total    NUMERIC(14, 2) NOT NULL,
-    hash_origem    TEXT NOT NULL UNIQUE,
-    inserido_em    TIMESTAMP NOT NULL DEFAULT NOW()
+    hash_origem    TEXT NOT NULL,
+    inserido_em    TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (venda_id, data_venda),
+    UNIQUE (hash_origem, data_venda)
+) PARTITION BY RANGE (data_venda);
+
+-- Indice por data: filtros de periodo da API e pre-filtro de duplicatas do ETL
+CREATE INDEX IF NOT EXISTS idx_fato_vendas_data ON fato_vendas (data_venda);
+
+-- Cria (se ainda nao existir) a particao do mes de uma data e retorna o nome.
+-- A particao nasce como tabela comum e depois e anexada: o ATTACH so pede
+-- SHARE UPDATE EXCLUSIVE na fato, sem bloquear leituras nem outras cargas
+CREATE OR REPLACE FUNCTION criar_particao_fato_vendas(dia DATE) RETURNS TEXT AS $$
+DECLARE
+    inicio DATE := date_trunc('month', dia)::DATE;
+    fim    DATE := (date_trunc('month', dia) + INTERVAL '1 month')::DATE;
+    nome   TEXT := 'fato_vendas_' || to_char(date_trunc('month', dia), 'YYYY_MM');
+BEGIN
+    -- Serializa cargas simultaneas que encontram o mesmo mes novo
+    PERFORM pg_advisory_xact_lock(hashtext('criar_particao_fato_vendas'));
+    IF to_regclass(nome) IS NULL THEN
+        EXECUTE format('CREATE TABLE %I (LIKE fato_vendas INCLUDING DEFAULTS)', nome);
+        EXECUTE format(
+            'ALTER TABLE fato_vendas ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            nome, inicio, fim
+        );
+    END IF;
+    RETURN nome;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Copia os dados da fato_vendas antiga (se houver) para as particoes
+DO $$
+BEGIN
+    IF to_regclass('fato_vendas_legado') IS NOT NULL THEN
+        PERFORM criar_particao_fato_vendas(mes)
+        FROM (SELECT DISTINCT date_trunc('month', data_venda)::DATE AS mes FROM fato_vendas_legado) m;
+
+        INSERT INTO fato_vendas
+            (venda_id, data_venda, loja_id, produto_id, quantidade,
+             preco_unitario, desconto, valor_total, hash_origem, inserido_em)
+        SELECT venda_id, data_venda, loja_id, produto_id, quantidade,
+               preco_unitario, desconto, valor_total, hash_origem, inserido_em
+        FROM fato_vendas_legado;
+
+        PERFORM setval(
+            pg_get_serial_sequence('fato_vendas', 'venda_id'),
+            COALESCE((SELECT MAX(venda_id) FROM fato_vendas), 0) + 1,
+            false
+        );
+        DROP TABLE fato_vendas_legado;
+    END IF;
+END $$;
+
+-- Agregado diario de vendas: dia x loja x produto
+-- Mantido pelo ETL (app/etl/rollup.py); a API e o dashboard leem daqui
+-- em vez de somar as linhas da fato_vendas a cada consulta
+CREATE TABLE IF NOT EXISTS agg_vendas_diarias (
+    data_venda   DATE NOT NULL,
+    loja_id      BIGINT NOT NULL REFERENCES dim_loja (loja_id),
+    produto_id   BIGINT NOT NULL REFERENCES dim_produto (produto_id),
+    valor_total  NUMERIC(16, 2) NOT NULL,
+    quantidade   BIGINT NOT NULL,
+    desconto     NUMERIC(16, 2) NOT NULL,
+    linhas       BIGINT NOT NULL,
+    PRIMARY KEY (data_venda, loja_id, produto_id)
 );
 
+-- Dias com vendas novas ainda nao refletidas no agregado
+-- Sem chave unica de proposito: cargas simultaneas nao esperam uma pela outra
+CREATE TABLE IF NOT EXISTS agg_vendas_pendentes (
+    data_venda   DATE NOT NULL
+);
+
+-- Bancos que ja tinham vendas antes do agregado: calcula tudo uma vez
+INSERT INTO agg_vendas_diarias
+    (data_venda, loja_id, produto_id, valor_total, quantidade, desconto, linhas)
+SELECT data_venda, loja_id, produto_id,
+       SUM(valor_total), SUM(quantidade), SUM(desconto), COUNT(*)
+FROM fato_vendas
+WHERE NOT EXISTS (SELECT 1 FROM agg_vendas_diarias)
+GROUP BY data_venda, loja_id, produto_id;
+
 -- Controle de execucoes do ETL
 -- Registra cada vez que o pipeline roda, com status e contadores
 CREATE TABLE IF NOT EXISTS etl_execucoes (
@@ -46,5 +144,85 @@ CREATE TABLE IF NOT EXISTS etl_execucoes (
     linhas_inseridas   INTEGER DEFAULT 0,
     linhas_ignoradas   INTEGER DEFAULT 0,
     status             TEXT NOT NULL DEFAULT 'executando',
-    mensagem_erro      TEXT
-);
\ No newline at end of file
+    mensagem_erro      TEXT,
+    execucao_pai_id    BIGINT REFERENCES etl_execucoes (execucao_id),
+    -- Ponto de retomada: arquivo, ultimo bloco com commit e byte (CSV)
+    -- ou linha (Parquet/Arrow) em que esse bloco termina
+    checkpoint_arquivo TEXT,
+    checkpoint_bloco   INTEGER,
+    checkpoint_offset  BIGINT
+);
+
+-- Versao dos dados servidos pela API (linha unica), usada pelo cache de respostas
+-- Avanca a cada recalculo do agregado, particao desanexada ou migracao do hash
+CREATE TABLE IF NOT EXISTS etl_versao_dados (
+    unica          BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (unica),
+    versao         BIGINT NOT NULL DEFAULT 0,
+    atualizado_em  TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO etl_versao_dados (unica) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- Manifesto de arquivos ja ingeridos
+-- Guarda tamanho, mtime, checksum e ate que byte cada arquivo foi lido,
+-- para pular arquivos sem mudanca e ler so o final dos que cresceram
+CREATE TABLE IF NOT EXISTS etl_arquivos (
+    caminho            TEXT PRIMARY KEY,
+    tamanho_bytes      BIGINT NOT NULL,
+    modificado_em_ns   BIGINT NOT NULL,
+    checksum           TEXT NOT NULL,
+    offset_bytes       BIGINT NOT NULL,
+    execucao_id        BIGINT REFERENCES etl_execucoes (execucao_id),
+    atualizado_em      TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Medicoes de cada etapa do ETL (leitura, limpeza, hash, dimensoes, fatos)
+-- Uma linha por etapa e bloco; bloco nulo e o total da etapa na execucao
+CREATE TABLE IF NOT EXISTS etl_etapas (
+    etapa_id           BIGSERIAL PRIMARY KEY,
+    execucao_id        BIGINT NOT NULL REFERENCES etl_execucoes (execucao_id),
+    etapa              TEXT NOT NULL,
+    bloco              INTEGER,
+    segundos           DOUBLE PRECISION NOT NULL,
+    linhas             BIGINT NOT NULL DEFAULT 0,
+    linhas_por_seg     DOUBLE PRECISION,
+    idas_ao_banco      INTEGER NOT NULL DEFAULT 0,
+    pico_rss_mb        DOUBLE PRECISION
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_etapas_execucao ON etl_etapas (execucao_id);
+
+-- Linhas rejeitadas pelas regras de validacao do ETL (quarentena)
+-- Guarda o motivo e os valores originais; as demais linhas do bloco seguem
+CREATE TABLE IF NOT EXISTS etl_quarentena (
+    quarentena_id      BIGSERIAL PRIMARY KEY,
+    execucao_id        BIGINT NOT NULL REFERENCES etl_execucoes (execucao_id),
+    bloco              INTEGER,
+    motivo             TEXT NOT NULL,
+    linha              JSONB NOT NULL,
+    inserido_em        TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_quarentena_execucao ON etl_quarentena (execucao_id);
+
+-- Vendas inseridas por cada faixa da carga paralela (ETL_FACT_CONNECTIONS > 1)
+-- Gravada no mesmo commit da faixa: se a execucao cai antes do checkpoint do
+-- bloco, a retomada sabe quantas linhas do bloco ja tinham entrado
+CREATE TABLE IF NOT EXISTS etl_faixas_carregadas (
+    execucao_id        BIGINT NOT NULL REFERENCES etl_execucoes (execucao_id),
+    bloco              INTEGER NOT NULL,
+    linhas_inseridas   BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_faixas_carregadas ON etl_faixas_carregadas (execucao_id, bloco);
+
+-- Atualizacoes para bancos criados com versoes anteriores deste schema
+-- Execucao pai: agrupa as execucoes de cada arquivo numa carga de varios arquivos
+ALTER TABLE etl_execucoes
+    ADD COLUMN IF NOT EXISTS execucao_pai_id BIGINT REFERENCES etl_execucoes (execucao_id);
+
+-- Checkpoint por bloco, usado para retomar execucoes interrompidas (--resume)
+ALTER TABLE etl_execucoes
+    ADD COLUMN IF NOT EXISTS checkpoint_arquivo TEXT,
+    ADD COLUMN IF NOT EXISTS checkpoint_bloco INTEGER,
+    ADD COLUMN IF NOT EXISTS checkpoint_offset BIGINT;
@@ -0,0 +1,29 @@
+# Testes da leitura de arquivos de vendas (extract).
+
+import warnings
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.etl.extract import _to_frame, read_file_blocks
+
+
+def test_to_frame_turns_text_nulls_into_nan_without_warnings():
+    table = pa.table({
+        "store_name": pa.array(["Loja A", None], pa.string()),
+        "category": pa.array([None, None], pa.string()),
+    })
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        df = _to_frame(table)
+    assert df["store_name"].isna().tolist() == [False, True]
+    assert df["category"].isna().all()
+
+
+def test_read_file_blocks_returns_row_positions_for_parquet(tmp_path):
+    path = tmp_path / "vendas.parquet"
+    pq.write_table(pa.table({"quantity": list(range(5))}), path)
+
+    blocks = list(read_file_blocks(path, 2, end=123))
+    assert [len(df) for df, _ in blocks] == [2, 2, 1]
+    assert [position for _, position in blocks] == [2, 4, 5]
@@ -0,0 +1,37 @@
+# Testes do planejamento de leitura incremental (manifest.plan_file).
+
+from app.etl.manifest import plan_file
+
+
+def _entry(plan):
+    """Entrada do manifesto como record_file gravaria para o plano."""
+    return {
+        "tamanho_bytes": plan.size,
+        "modificado_em_ns": plan.mtime_ns,
+        "checksum": plan.checksum,
+        "offset_bytes": plan.end,
+    }
+
+
+def test_plan_file_stops_before_a_partial_last_line(tmp_path):
+    path = tmp_path / "vendas.csv"
+    path.write_bytes(b"quantity\n10\n2")
+
+    plan = plan_file(path, None)
+    assert (plan.action, plan.offset, plan.end) == ("full", 0, len(b"quantity\n10\n"))
+
+    # O produtor termina a linha e grava mais uma: só o trecho novo é lido
+    with open(path, "ab") as f:
+        f.write(b"5\n30\n")
+    tail = plan_file(path, _entry(plan))
+    assert (tail.action, tail.offset, tail.end) == ("tail", plan.end, path.stat().st_size)
+
+
+def test_plan_file_reads_an_unterminated_last_line_once_the_file_is_stable(tmp_path):
+    path = tmp_path / "vendas.csv"
+    path.write_bytes(b"quantity\n10\n25")
+
+    plan = plan_file(path, None)
+    tail = plan_file(path, _entry(plan))
+    assert (tail.action, tail.offset, tail.end) == ("tail", plan.end, path.stat().st_size)
+    assert plan_file(path, _entry(tail)).action == "skip"
@@ -0,0 +1,35 @@
+# Testes da gravação de linhas rejeitadas (load.quarantine_rows).
+
+import json
+
+import pandas as pd
+
+from app.etl.load import quarantine_rows
+
+
+class _FakeSession:
+    """Sessão que só guarda os parâmetros de cada execute."""
+
+    def __init__(self):
+        self.params = []
+
+    def execute(self, statement, params=None):
+        self.params.append(params)
+
+
+def test_quarantine_rows_keeps_one_json_per_row_with_unicode_line_breaks():
+    rejected = pd.DataFrame({
+        "store_name": ["Loja x\u2028y", "Loja p\x85q", "Loja\x0bA\x0cB"],
+        "product_name": ["a\nb", "c", "d e"],
+        "motivo": ["quantidade", "preco", "data"],
+    })
+    session = _FakeSession()
+
+    assert quarantine_rows(session, 1, 0, rejected) == 3
+
+    params = session.params[0]
+    assert params["motivos"] == ["quantidade", "preco", "data"]
+    assert len(params["linhas"]) == 3
+    linhas = [json.loads(linha) for linha in params["linhas"]]
+    assert [linha["store_name"] for linha in linhas] == rejected["store_name"].tolist()
+    assert [linha["product_name"] for linha in linhas] == rejected["product_name"].tolist()
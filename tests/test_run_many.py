@@ -0,0 +1,65 @@
+# Testes da carga de vários arquivos (run_etl.run_many) com o pool de processos quebrado.
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+from app.etl import run_etl
+from app.etl.manifest import FilePlan
+
+
+class _FakeSession:
+    def execute(self, *args, **kwargs):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _BreakingPool:
+    """Pool que aceita `ok` envios e quebra no seguinte."""
+
+    def __init__(self, ok: int):
+        self.ok = ok
+
+    def submit(self, fn, *args):
+        if self.ok == 0:
+            raise BrokenProcessPool("processo morreu")
+        self.ok -= 1
+        future = Future()
+        future.set_result(None)
+        return future
+
+
+def test_run_many_reports_files_never_sent_to_a_broken_pool(monkeypatch):
+    paths = [Path(f"vendas_{i}.csv") for i in range(3)]
+    loaded = []
+
+    def load_file(plan, transformed, parent_id, dim_lock, metrics):
+        loaded.append(plan.path)
+        return 1, 1, 0
+
+    monkeypatch.setattr(run_etl, "SessionLocal", _FakeSession)
+    monkeypatch.setattr(run_etl, "check_hash_mode", lambda session: None)
+    monkeypatch.setattr(run_etl, "plan_sources", lambda session, paths, force: [
+        FilePlan(p, "full", 0, 10, 0, "", 10) for p in paths
+    ])
+    monkeypatch.setattr(run_etl, "start_execution", lambda session, name: 1)
+    monkeypatch.setattr(run_etl, "fail_execution", lambda session, run_id, error: None)
+    monkeypatch.setattr(run_etl, "refresh_rollup", lambda session: 0)
+    monkeypatch.setattr(run_etl, "_load_file", load_file)
+
+    with pytest.raises(run_etl.FilesFailedError) as exc:
+        run_etl.run_many("entrada", workers=1, connections=1, paths=paths, processes=_BreakingPool(1))
+
+    assert loaded == paths[:1]
+    assert exc.value.failed == paths[1:]
+    assert exc.value.broken == paths[1:]